@@ -1,16 +1,48 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from openai import OpenAI
-from .routes import hint, code_analysis, ai_answer
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 import os
 
+# Loaded before the routes, whose services are configured from the environment on import
 load_dotenv()
 
+from .routes import hint, code_analysis, ai_answer, cache
+from .services.cache import response_cache
+from .services.openai_service import close_client
+from .services.question_service import QUESTION_PREFETCH, question_client
+
+
+logger = logging.getLogger(__name__)
+
+
+async def prefetch_questions():
+    try:
+        count = await question_client.prefetch()
+        logger.info(f"Prefetched {count} question descriptions")
+    except Exception as e:
+        logger.warning(f"Failed to prefetch question descriptions: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # In the background, as the question service may start after this one
+    prefetch = asyncio.ensure_future(prefetch_questions()) if QUESTION_PREFETCH else None
+    yield
+    if prefetch is not None:
+        prefetch.cancel()
+    await question_client.close()
+    await response_cache.close()
+    await close_client()
+
+
 app = FastAPI(
     title="AI Hint Service",
     description="Provides AI-generated hints, code complexity analysis, and model answers.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 
@@ -30,6 +62,7 @@ app.add_middleware(
 app.include_router(hint.router, prefix="/api/hint", tags=["Hint"])
 app.include_router(code_analysis.router, prefix="/api/code-analysis", tags=["Code Analysis"])
 app.include_router(ai_answer.router, prefix="/api/ai_answer", tags=["Model Answer"])
+app.include_router(cache.router, prefix="/api/cache", tags=["Cache"])
 
 # Root endpoint
 @app.get("/")
@@ -1,37 +1,46 @@
-from fastapi import APIRouter, HTTPException
-from ..services.openai_service import generate_ai_answer
+from fastapi import APIRouter, HTTPException, Request
+from .disconnect import cancel_on_disconnect
+from .sse import event_stream
+from ..services.cache import response_cache
+from ..services.question_service import question_client
+from ..services.openai_service import CompletionUnavailable, generate_ai_answer, ai_answer_cache_key, stream_ai_answer
 from ..schemas.ai_answer import AiAnswerRequest, AiAnswerResponse
-from typing import Optional
 
 router = APIRouter()
 
 @router.post("/", response_model=AiAnswerResponse)
-async def get_ai_answer(request: AiAnswerRequest):
+async def get_ai_answer(request: AiAnswerRequest, raw_request: Request):
     """
     Generate a model answer for the given question ID.
     """
-    # Placeholder: Fetch question description from the question service
-    question_description = fetch_question_description(request.question_id)
-    if not question_description:
-        raise HTTPException(status_code=404, detail="Question not found.")
-    
+    async def compute() -> str:
+        question_description = await question_client.get_description(request.question_id)
+        if not question_description:
+            raise HTTPException(status_code=404, detail="Question not found.")
+        return await generate_ai_answer(question_description, language=request.language)
+
     try:
-        ai_answer = generate_ai_answer(question_description, language=request.language)  
-        print(ai_answer)
+        ai_answer = await cancel_on_disconnect(raw_request, response_cache.get_or_compute(
+            ai_answer_cache_key(request.question_id, request.language), compute))
         return AiAnswerResponse(ai_answer=ai_answer)
+    except HTTPException:
+        raise
+    except CompletionUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-def fetch_question_description(question_id: int) -> Optional[str]:
-    # Implement the logic to fetch question description from the question service
-    import requests
-    QUESTION_SERVICE_URL = "http://question:3002"
-    try:
-        response = requests.get(f"{QUESTION_SERVICE_URL}/{question_id}")
-        if response.status_code == 200:
-            data = response.json()
-            return data.get("description")
-        else:
-            return None
-    except Exception as e:
-        return None
+@router.post("/stream")
+async def stream_ai_answer_events(request: AiAnswerRequest, raw_request: Request):
+    """
+    Generate a model answer for the given question ID, streamed as server-sent events.
+    """
+    async def stream():
+        question_description = await question_client.get_description(request.question_id)
+        if not question_description:
+            raise HTTPException(status_code=404, detail="Question not found.")
+        async for token in stream_ai_answer(question_description, language=request.language):
+            yield token
+
+    return event_stream(raw_request, response_cache.stream_or_compute(
+        ai_answer_cache_key(request.question_id, request.language), stream), "ai_answer")
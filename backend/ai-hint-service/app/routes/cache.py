@@ -0,0 +1,21 @@
+from fastapi import APIRouter
+from ..services.cache import response_cache
+from ..services.question_service import question_client
+
+router = APIRouter()
+
+@router.get("/stats")
+async def get_cache_stats():
+    """
+    Hit and miss counters of the response cache.
+    """
+    return response_cache.stats()
+
+@router.delete("/questions/{question_id}")
+async def invalidate_question(question_id: int):
+    """
+    Drop the cached description, hints and model answers of a question, e.g. after it was edited.
+    """
+    question_client.invalidate(question_id)
+    removed = await response_cache.invalidate(f"q:{question_id}:")
+    return {"removed": removed}
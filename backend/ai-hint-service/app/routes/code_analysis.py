@@ -1,16 +1,51 @@
-from fastapi import APIRouter, HTTPException
-from ..services.openai_service import analyze_code_complexity
+from fastapi import APIRouter, HTTPException, Request
+from .disconnect import cancel_on_disconnect
+from .sse import event_stream
+from ..services.cache import response_cache
+from ..services.openai_service import (
+    CompletionUnavailable, analyze_code_complexity, code_analysis_cache_key, stream_code_analysis)
+from ..services.static_analysis import analyze
 from ..schemas.code_analysis import CodeAnalysisRequest, CodeAnalysisResponse
 
 router = APIRouter()
 
 @router.post("/", response_model=CodeAnalysisResponse)
-async def get_code_analysis(request: CodeAnalysisRequest):
+async def get_code_analysis(request: CodeAnalysisRequest, raw_request: Request):
     """
     Analyze the complexity of the provided code.
     """
+    async def compute() -> str:
+        facts = analyze(request.code, request.language)
+        if facts is not None and facts.answer is not None:
+            return facts.answer
+        result = await analyze_code_complexity(
+            request.code, request.language, facts.notes() if facts is not None else None)
+        return result["analysis"]
+
     try:
-        result = analyze_code_complexity(request.code, request.language)
-        return CodeAnalysisResponse(**result)
+        analysis = await cancel_on_disconnect(raw_request, response_cache.get_or_compute(
+            code_analysis_cache_key(request.code, request.language), compute))
+        return CodeAnalysisResponse(analysis=analysis)
+    except HTTPException:
+        raise
+    except CompletionUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/stream")
+async def stream_code_analysis_events(request: CodeAnalysisRequest, raw_request: Request):
+    """
+    Analyze the complexity of the provided code, streamed as server-sent events.
+    """
+    async def stream():
+        facts = analyze(request.code, request.language)
+        if facts is not None and facts.answer is not None:
+            yield facts.answer
+            return
+        async for token in stream_code_analysis(
+                request.code, request.language, facts.notes() if facts is not None else None):
+            yield token
+
+    return event_stream(raw_request, response_cache.stream_or_compute(
+        code_analysis_cache_key(request.code, request.language), stream), "analysis")
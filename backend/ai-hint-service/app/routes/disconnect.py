@@ -0,0 +1,35 @@
+import asyncio
+from typing import Awaitable, TypeVar
+
+from fastapi import HTTPException, Request
+
+T = TypeVar("T")
+
+# Non-standard status of nginx for a request whose client went away, only seen in logs
+CLIENT_CLOSED_REQUEST = 499
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T]) -> T:
+    """
+    Awaits `awaitable`, cancelling it if the client disconnects first, so that the completion of a
+    user who closed the page or retried does not keep holding a slot. Requests for the same cached
+    response share one completion, which is only cancelled once every one of them is gone.
+    """
+    work = asyncio.ensure_future(awaitable)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(request))
+    try:
+        await asyncio.wait({work, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnected.cancel()
+        if not work.done():
+            work.cancel()
+    # Cancelled work is only done once it has run again, so it is still pending here
+    if not work.done():
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request.")
+    return work.result()
+
+
+async def wait_for_disconnect(request: Request) -> None:
+    # The body has already been read, so the only message left to receive is the disconnect
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
@@ -1,40 +1,45 @@
-from fastapi import APIRouter, HTTPException
-from ..services.openai_service import generate_hint
+from fastapi import APIRouter, HTTPException, Request
+from .disconnect import cancel_on_disconnect
+from .sse import event_stream
+from ..services.cache import response_cache
+from ..services.question_service import question_client
+from ..services.openai_service import CompletionUnavailable, generate_hint, hint_cache_key, stream_hint
 from ..schemas.hint import HintResponse
-from typing import Optional
-import requests
-import os
 
 router = APIRouter()
 
 @router.get("/{question_id}", response_model=HintResponse)
-async def get_hint(question_id: int):
+async def get_hint(question_id: int, raw_request: Request):
     """
     Generate a hint for the given question ID.
     """
-    question_description = fetch_question_description(question_id)
-    if not question_description:
-        raise HTTPException(status_code=404, detail="Question not found.")
-    
-    try:       
-        hint = generate_hint(question_description)
+    async def compute() -> str:
+        question_description = await question_client.get_description(question_id)
+        if not question_description:
+            raise HTTPException(status_code=404, detail="Question not found.")
+        return await generate_hint(question_description)
+
+    try:
+        hint = await cancel_on_disconnect(
+            raw_request, response_cache.get_or_compute(hint_cache_key(question_id), compute))
         return HintResponse(hint=hint)
+    except HTTPException:
+        raise
+    except CompletionUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-def fetch_question_description(question_id: int) -> Optional[str]:
-    # Implement the logic to fetch question description from the question service
-    # For example, make an HTTP request to the question service's API
+@router.get("/{question_id}/stream")
+async def stream_hint_events(question_id: int, raw_request: Request):
+    """
+    Generate a hint for the given question ID, streamed as server-sent events.
+    """
+    async def stream():
+        question_description = await question_client.get_description(question_id)
+        if not question_description:
+            raise HTTPException(status_code=404, detail="Question not found.")
+        async for token in stream_hint(question_description):
+            yield token
 
-    QUESTION_SERVICE_URL = os.getenv("QUESTION_SERVICE_URL")
-    try:
-        link = f"{QUESTION_SERVICE_URL}/{question_id}"
-        print(link)
-        response = requests.get(link)
-        if response.status_code == 200:
-            data = response.json()
-            return data.get("description")
-        else:
-            return None
-    except Exception as e:
-        return None
+    return event_stream(raw_request, response_cache.stream_or_compute(hint_cache_key(question_id), stream), "hint")
@@ -0,0 +1,64 @@
+import json
+import asyncio
+import logging
+from typing import AsyncIterator
+
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from .disconnect import wait_for_disconnect
+from ..services.openai_service import CompletionUnavailable
+
+# Proxies such as nginx would otherwise hold the tokens back until the response is complete
+_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def event_stream(request: Request, tokens: AsyncIterator[str], field: str) -> StreamingResponse:
+    """
+    Server-sent events of the completion `tokens`:
+
+    - `token`, `{"token": "..."}` for every chunk as it arrives,
+    - `done`, with the whole text under `field` as in the non-streaming response,
+    - or `error`, `{"status": 404, "detail": "..."}` if it failed, since the response has
+      already started by then.
+
+    `tokens` is closed as soon as the client disconnects, even while waiting for the next token,
+    which cancels the completion unless another request is following it.
+    """
+    return StreamingResponse(_events(request, tokens, field), media_type="text/event-stream", headers=_HEADERS)
+
+
+async def _events(request: Request, tokens: AsyncIterator[str], field: str) -> AsyncIterator[str]:
+    parts = []
+    disconnected = asyncio.ensure_future(wait_for_disconnect(request))
+    try:
+        while True:
+            step = asyncio.ensure_future(tokens.__anext__())
+            await asyncio.wait({step, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not step.done():
+                # Raises CancelledError inside the generator, which closes it
+                step.cancel()
+                return
+            try:
+                token = step.result()
+            except StopAsyncIteration:
+                break
+            parts.append(token)
+            yield _event("token", {"token": token})
+    except HTTPException as e:
+        yield _event("error", {"status": e.status_code, "detail": e.detail})
+        return
+    except CompletionUnavailable as e:
+        yield _event("error", {"status": 503, "detail": str(e)})
+        return
+    except Exception as e:
+        logging.exception("Streamed completion failed")
+        yield _event("error", {"status": 500, "detail": str(e)})
+        return
+    finally:
+        disconnected.cancel()
+    yield _event("done", {field: "".join(parts)})
+
+
+def _event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
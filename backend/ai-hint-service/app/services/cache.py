@@ -0,0 +1,227 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """
+    A computation in progress, the number of callers waiting for it and, for streamed values, the
+    chunks produced so far.
+    """
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        self.chunks: List[str] = []
+        self._changed = asyncio.Event()
+
+    def publish(self, chunk: str) -> None:
+        self.chunks.append(chunk)
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait(self, seen: int) -> None:
+        """Waits until there are more than `seen` chunks, or the computation is over."""
+        if len(self.chunks) > seen or self.task.done():
+            return
+        changed = asyncio.ensure_future(self._changed.wait())
+        try:
+            await asyncio.wait({self.task, changed}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            changed.cancel()
+
+
+class ResponseCache:
+    """
+    Two-tier cache of model responses: an in-process LRU in front of Redis, shared by every
+    instance. Both tiers expire entries after a TTL. Concurrent misses for the same key share a
+    single computation. Without a Redis URL only the in-process tier is used, and Redis errors
+    are logged and treated as misses so that the cache never fails a request.
+    """
+
+    def __init__(self, redis_url: Optional[str], ttl: int, local_ttl: float, local_size: int,
+                 namespace: str = "ai-hint"):
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.local_size = local_size
+        self.namespace = namespace
+        self._redis = aioredis.from_url(redis_url) if redis_url else None
+        self._local: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._inflight: Dict[str, _Flight] = {}
+        self._stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "shared": 0,
+                       "computations": 0, "redis_errors": 0}
+
+    async def get(self, key: str) -> Optional[str]:
+        cached = self._local.get(key)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                self._local.move_to_end(key)
+                self._stats["local_hits"] += 1
+                return cached[1]
+            del self._local[key]
+
+        if self._redis is not None:
+            try:
+                value = await self._redis.get(self._redis_key(key))
+            except RedisError as e:
+                self._stats["redis_errors"] += 1
+                logger.warning(f"Response cache lookup failed: {e}")
+                value = None
+            if value is not None:
+                self._stats["redis_hits"] += 1
+                value = value.decode()
+                self._set_local(key, value)
+                return value
+
+        self._stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: str) -> None:
+        self._set_local(key, value)
+        if self._redis is not None:
+            try:
+                await self._redis.set(self._redis_key(key), value, ex=self.ttl)
+            except RedisError as e:
+                self._stats["redis_errors"] += 1
+                logger.warning(f"Response cache write failed: {e}")
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        """
+        Returns the cached value of `key`, or computes and caches it. The computation runs in its
+        own task shared by every concurrent caller, and is cancelled once none of them is waiting.
+        """
+        value = await self.get(key)
+        if value is not None:
+            return value
+
+        flight = self._join(key, lambda flight: compute())
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            self._leave(key, flight)
+
+    async def stream_or_compute(self, key: str, stream: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        Like `get_or_compute`, for a value produced in chunks: yields the cached value as a single
+        chunk, or the chunks of the shared computation as they come. Callers that join late first
+        get the chunks they missed. Joining a computation started by `get_or_compute` yields its
+        value once it is done.
+        """
+        value = await self.get(key)
+        if value is not None:
+            yield value
+            return
+
+        flight = self._join(key, lambda flight: self._collect(flight, stream()))
+        try:
+            seen = 0
+            while True:
+                await flight.wait(seen)
+                while seen < len(flight.chunks):
+                    yield flight.chunks[seen]
+                    seen += 1
+                if flight.task.done():
+                    break
+            value = flight.task.result()
+            if not seen and value:
+                yield value
+        finally:
+            self._leave(key, flight)
+
+    def _join(self, key: str, start: Callable[["_Flight"], Awaitable[str]]) -> "_Flight":
+        flight = self._inflight.get(key)
+        if flight is None:
+            self._stats["computations"] += 1
+            flight = _Flight()
+            flight.task = asyncio.ensure_future(self._compute(key, start(flight)))
+            self._inflight[key] = flight
+            flight.task.add_done_callback(lambda _: self._land(key, flight))
+        else:
+            self._stats["shared"] += 1
+        flight.waiters += 1
+        return flight
+
+    def _leave(self, key: str, flight: "_Flight") -> None:
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.task.done():
+            self._land(key, flight)
+            flight.task.cancel()
+
+    async def _compute(self, key: str, computation: Awaitable[str]) -> str:
+        value = await computation
+        await self.set(key, value)
+        return value
+
+    @staticmethod
+    async def _collect(flight: "_Flight", stream: AsyncIterator[str]) -> str:
+        async for chunk in stream:
+            flight.publish(chunk)
+        return "".join(flight.chunks)
+
+    def _land(self, key: str, flight: "_Flight") -> None:
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        if flight.task.done() and not flight.task.cancelled():
+            # Make sure the exception is retrieved even if no one was waiting on it any more
+            flight.task.exception()
+
+    async def invalidate(self, prefix: str) -> int:
+        """Removes every entry whose key starts with `prefix`. Returns how many were in Redis."""
+        for key in [key for key in self._local if key.startswith(prefix)]:
+            del self._local[key]
+        if self._redis is None:
+            return 0
+        removed = 0
+        try:
+            async for redis_key in self._redis.scan_iter(match=self._redis_key(prefix) + "*"):
+                removed += await self._redis.delete(redis_key)
+        except RedisError as e:
+            self._stats["redis_errors"] += 1
+            logger.warning(f"Response cache invalidation failed: {e}")
+        return removed
+
+    def stats(self) -> dict:
+        hits = self._stats["local_hits"] + self._stats["redis_hits"]
+        lookups = hits + self._stats["misses"]
+        return {
+            **self._stats,
+            "local_size": len(self._local),
+            "hit_rate": hits / lookups if lookups else None,
+            "redis": self._redis is not None,
+        }
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+
+    def _set_local(self, key: str, value: str) -> None:
+        self._local[key] = (time.monotonic() + self.local_ttl, value)
+        self._local.move_to_end(key)
+        if len(self._local) > self.local_size:
+            self._local.popitem(last=False)
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+
+def _redis_url() -> Optional[str]:
+    host = os.getenv("REDIS_HOST")
+    if not host:
+        return None
+    return f"redis://{host}:{os.getenv('REDIS_PORT', 6379)}/0"
+
+
+response_cache = ResponseCache(
+    _redis_url(),
+    ttl=int(os.getenv("CACHE_TTL", 24 * 60 * 60)),
+    local_ttl=float(os.getenv("LOCAL_CACHE_TTL", 5 * 60)),
+    local_size=int(os.getenv("LOCAL_CACHE_SIZE", 1000)),
+)
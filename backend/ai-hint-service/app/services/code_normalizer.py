@@ -0,0 +1,194 @@
+import re
+import ast
+import hashlib
+from typing import Dict, List, Optional, Set
+
+# Part of the digests, bump it when changing the normalization
+NORMALIZER_VERSION = 2
+
+PYTHON = {"python", "python3", "py"}
+_ALIASES = {"js": "javascript", "c++": "cpp"}
+
+# Names left as they are by the token normalization, as they are not the user's: keywords, and the
+# types and library objects whose choice changes the complexity (e.g. set vs vector)
+_KEPT_NAMES = {
+    "cpp": set("""
+        alignas alignof and asm auto bitand bitor bool break case catch char class compl const
+        constexpr const_cast continue decltype default delete do double dynamic_cast else enum
+        explicit extern false float for friend goto if inline int long mutable namespace new
+        noexcept not nullptr operator or private protected public register reinterpret_cast
+        return short signed sizeof static static_assert static_cast struct switch template this
+        throw true try typedef typeid typename union unsigned using virtual void volatile while
+        xor size_t std string vector array list deque queue stack priority_queue set multiset
+        unordered_set map multimap unordered_map pair tuple bitset greater less cout cin endl
+        include define
+    """.split()),
+    "java": set("""
+        abstract assert boolean break byte case catch char class const continue default do
+        double else enum extends final finally float for goto if implements import instanceof
+        int interface long native new null package private protected public return short static
+        strictfp super switch synchronized this throw throws transient true false try var void
+        volatile while length
+    """.split()),
+    "javascript": set("""
+        async await break case catch class const continue debugger default delete do else export
+        extends false finally for function if import in instanceof let new null of return static
+        super switch this throw true try typeof undefined var void while with yield length
+    """.split()),
+    "python": set("""
+        False None True and as assert async await break class continue def del elif else except
+        finally for from global if import in is lambda nonlocal not or pass raise return try
+        while with yield self cls
+    """.split()),
+}
+
+_TOKENS = re.compile(r"""
+      (?P<comment>//[^\n]*|/\*.*?\*/)
+    | (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+    | (?P<number>\d[\w.]*)
+    | (?P<name>[A-Za-z_]\w*)
+    | (?P<space>\s+)
+    | (?P<op>.)
+""", re.DOTALL | re.VERBOSE)
+_PYTHON_COMMENT = re.compile(r"#[^\n]*")
+_MEMBER_ACCESS = {".", "->", "::"}
+
+
+def code_digest(code: str, language: str) -> str:
+    """
+    A digest of the code that is the same for code that only differs in whitespace, comments or
+    the names of its own variables, functions and parameters. Code in a language without a list of
+    kept names is only deduplicated when it is the same text.
+    """
+    normalized = normalize(code, language)
+    return hashlib.sha256(f"{NORMALIZER_VERSION}:{normalized}".encode()).hexdigest()
+
+
+def normalize(code: str, language: str) -> str:
+    language = language.lower()
+    language = _ALIASES.get(language, language)
+    if language in PYTHON:
+        try:
+            return _normalize_python(code)
+        except (SyntaxError, ValueError, RecursionError):
+            # Code that does not parse, or is nested too deeply to, is still deduplicated as text
+            return _normalize_tokens(_PYTHON_COMMENT.sub(" ", code), "python")
+    if language not in _KEPT_NAMES:
+        # Renaming would also rename the keywords, and tell apart less than it conflates
+        return code
+    return _normalize_tokens(code, language)
+
+
+def _normalize_python(code: str) -> str:
+    tree = ast.parse(code)
+    return ast.dump(_Canonicalizer(_bound_names(tree)).visit(tree))
+
+
+def _bound_names(tree: ast.AST) -> Set[str]:
+    """The names the code binds itself, and can be renamed without changing what it does."""
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+    # Imported names refer to libraries, whatever they are bound to
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.difference_update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+    return names
+
+
+class _Canonicalizer(ast.NodeTransformer):
+    """
+    Renames the bound names in order of first appearance, and removes docstrings. The new names
+    are not valid identifiers, so they cannot collide with a name left as it is.
+    """
+
+    def __init__(self, bound: Set[str]):
+        self.bound = bound
+        self.renamed: Dict[str, str] = {}
+
+    def rename(self, name: str) -> str:
+        if name not in self.bound:
+            return name
+        return self.renamed.setdefault(name, f"${len(self.renamed)}")
+
+    def visit_Name(self, node: ast.Name) -> ast.AST:
+        node.id = self.rename(node.id)
+        return node
+
+    def visit_arg(self, node: ast.arg) -> ast.AST:
+        node.arg = self.rename(node.arg)
+        self.generic_visit(node)
+        return node
+
+    def visit_keyword(self, node: ast.keyword) -> ast.AST:
+        if node.arg is not None:
+            node.arg = self.rename(node.arg)
+        self.generic_visit(node)
+        return node
+
+    def visit_ExceptHandler(self, node: ast.ExceptHandler) -> ast.AST:
+        if node.name:
+            node.name = self.rename(node.name)
+        self.generic_visit(node)
+        return node
+
+    def visit_Global(self, node: ast.Global) -> ast.AST:
+        node.names = [self.rename(name) for name in node.names]
+        return node
+
+    visit_Nonlocal = visit_Global
+
+    def visit_FunctionDef(self, node: ast.AST) -> ast.AST:
+        node.name = self.rename(node.name)
+        self.generic_visit(node)
+        return node
+
+    visit_AsyncFunctionDef = visit_ClassDef = visit_FunctionDef
+
+    def visit_Expr(self, node: ast.Expr) -> Optional[ast.AST]:
+        # The tree is only dumped, so a body left empty does not matter
+        if isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+            return None
+        self.generic_visit(node)
+        return node
+
+
+def _normalize_tokens(code: str, language: str) -> str:
+    """
+    The tokens of the code separated by single spaces, without comments, and with the names that
+    look like the user's own (not kept, not members, not called, not capitalized types) renamed.
+    """
+    kept = _KEPT_NAMES[language]
+    tokens: List[str] = []
+    kinds: List[str] = []
+    for match in _TOKENS.finditer(code):
+        if match.lastgroup not in ("comment", "space"):
+            tokens.append(match.group())
+            kinds.append(match.lastgroup)
+    # Two-character operators, so that member access can be told apart
+    merged_tokens: List[str] = []
+    merged_kinds: List[str] = []
+    for token, kind in zip(tokens, kinds):
+        if merged_tokens and merged_kinds[-1] == "op" and kind == "op" and merged_tokens[-1] + token in _MEMBER_ACCESS:
+            merged_tokens[-1] += token
+        else:
+            merged_tokens.append(token)
+            merged_kinds.append(kind)
+
+    renamed: Dict[str, str] = {}
+    for i, (token, kind) in enumerate(zip(merged_tokens, merged_kinds)):
+        if kind != "name" or token in kept or token[0].isupper():
+            continue
+        if i > 0 and merged_tokens[i - 1] in _MEMBER_ACCESS:
+            continue
+        if i + 1 < len(merged_tokens) and merged_tokens[i + 1] == "(":
+            continue
+        merged_tokens[i] = renamed.setdefault(token, f"${len(renamed)}")
+    return " ".join(merged_tokens)
@@ -1,31 +1,135 @@
+import os
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
+
 import openai
+from openai import AsyncOpenAI
+
+from .code_normalizer import code_digest
+from .static_analysis import CODE_ANALYSIS_LOCAL
 
 model = 'gpt-3.5-turbo-0125'
+# Part of the cache keys of responses, bump it when changing a prompt
+PROMPT_VERSION = 1
+
+# Completions in flight at once, across all routes; more requests wait for a slot
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", 50))
+# Seconds a request may wait for a slot before it is turned away
+OPENAI_QUEUE_TIMEOUT = float(os.getenv("OPENAI_QUEUE_TIMEOUT", 10))
+# Seconds for a single completion, retries included
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", 60))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 2))
+
+# Both created on first use: the client needs OPENAI_API_KEY to be set, and on Python 3.9 the
+# semaphore binds to the event loop current at construction
+_client: Optional[AsyncOpenAI] = None
+_limiter: Optional[asyncio.Semaphore] = None
+
+
+class CompletionUnavailable(Exception):
+    """The model could not be asked in time: too many completions queued, or it timed out."""
+
+
+def hint_cache_key(question_id: int) -> str:
+    return f"q:{question_id}:hint:{model}:v{PROMPT_VERSION}"
+
+def ai_answer_cache_key(question_id: int, language: str) -> str:
+    return f"q:{question_id}:ai_answer:{language}:{model}:v{PROMPT_VERSION}"
+
+def code_analysis_cache_key(code: str, language: str) -> str:
+    # Shared by code that only differs in formatting, comments or names, whose analysis may then
+    # use the names of the code it was made for. Analyses made with and without the static
+    # analysis differ, so that setting is part of the key too
+    return (f"code:{language.lower()}:{code_digest(code, language)}:analysis:{model}:v{PROMPT_VERSION}"
+            f":local-{CODE_ANALYSIS_LOCAL}")
+
+def get_client() -> AsyncOpenAI:
+    global _client
+    if _client is None:
+        # Also reads OPENAI_BASE_URL, to point the service at another compatible server
+        _client = AsyncOpenAI(timeout=OPENAI_TIMEOUT, max_retries=OPENAI_MAX_RETRIES)
+    return _client
+
+async def close_client() -> None:
+    if _client is not None:
+        await _client.close()
 
-def generate_hint(question_description: str) -> str:
-    prompt = f"Provide a concise hint to achieve the most efficient time complexity for the following programming problem:\n\n{question_description}\n\nHint:"
-    completion = openai.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": prompt}
-        ]
-    )
-
-    hint = completion.choices[0].message.content
-    return hint
-
-def analyze_code_complexity(code: str, language: str) -> dict:
-    prompt = f"Analyze the following {language} code for its time and space complexity. Provide a detailed explanation.\n\nCode:\n{code}\n\nAnalysis:"
-    print(prompt)
-    completion = openai.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": prompt}
-        ]
-    )
-    analysis = completion.choices[0].message.content
+@asynccontextmanager
+async def _slot():
+    global _limiter
+    if _limiter is None:
+        _limiter = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+    try:
+        await asyncio.wait_for(_limiter.acquire(), OPENAI_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise CompletionUnavailable("Too many requests to the model, try again later.")
+    try:
+        yield
+    finally:
+        _limiter.release()
+
+def _messages(prompt: str) -> list:
+    return [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": prompt}
+    ]
+
+async def _complete(prompt: str) -> str:
+    async with _slot():
+        try:
+            completion = await asyncio.wait_for(get_client().chat.completions.create(
+                model=model,
+                messages=_messages(prompt)
+            ), OPENAI_TIMEOUT)
+        except (asyncio.TimeoutError, openai.APITimeoutError):
+            raise CompletionUnavailable("The model did not answer in time.")
+    return completion.choices[0].message.content
+
+async def _stream(prompt: str) -> AsyncIterator[str]:
+    """
+    Yields the completion of `prompt` as the model writes it. OPENAI_TIMEOUT bounds the wait for
+    the first chunk and between chunks rather than the whole completion, which may run longer.
+    """
+    async with _slot():
+        try:
+            stream = await asyncio.wait_for(get_client().chat.completions.create(
+                model=model,
+                messages=_messages(prompt),
+                stream=True
+            ), OPENAI_TIMEOUT)
+        except (asyncio.TimeoutError, openai.APITimeoutError):
+            raise CompletionUnavailable("The model did not answer in time.")
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except openai.APITimeoutError:
+            raise CompletionUnavailable("The model stopped answering.")
+        finally:
+            await stream.close()
+
+def _hint_prompt(question_description: str) -> str:
+    return f"Provide a concise hint to achieve the most efficient time complexity for the following programming problem:\n\n{question_description}\n\nHint:"
+
+def _analysis_prompt(code: str, language: str, notes: Optional[List[str]] = None) -> str:
+    prompt = f"Analyze the following {language} code for its time and space complexity. Provide a detailed explanation.\n\nCode:\n{code}\n\n"
+    if notes:
+        facts = "\n".join(f"- {note}" for note in notes)
+        prompt += f"Static analysis of the code found the following, check your analysis against it:\n{facts}\n\n"
+    return prompt + "Analysis:"
+
+def _ai_answer_prompt(question_description: str, language: str) -> str:
+    return f"Provide a complete and optimized {language} solution to achieve the most efficient time complexity for the following programming problem:\n\n{question_description}\n\nSolution:"
+
+async def generate_hint(question_description: str) -> str:
+    return await _complete(_hint_prompt(question_description))
+
+def stream_hint(question_description: str) -> AsyncIterator[str]:
+    return _stream(_hint_prompt(question_description))
+
+async def analyze_code_complexity(code: str, language: str, notes: Optional[List[str]] = None) -> dict:
+    analysis = await _complete(_analysis_prompt(code, language, notes))
     # if "O(" in analysis:
     #     start = analysis.find("O(")
     #     end = analysis.find(")", start) + 1
@@ -35,15 +139,11 @@ def analyze_code_complexity(code: str, language: str) -> dict:
     # return {"complexity": complexity, "analysis": analysis}
     return {"analysis": analysis}
 
-def generate_ai_answer(question_description: str, language: str) -> str:
-    prompt = f"Provide a complete and optimized {language} solution to achieve the most efficient time complexity for the following programming problem:\n\n{question_description}\n\nSolution:"
-    print(prompt)
-    completion = openai.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant."},
-            {"role": "user", "content": prompt}
-        ]
-    )
-    ai_answer = completion.choices[0].message.content
-    return ai_answer
+def stream_code_analysis(code: str, language: str, notes: Optional[List[str]] = None) -> AsyncIterator[str]:
+    return _stream(_analysis_prompt(code, language, notes))
+
+async def generate_ai_answer(question_description: str, language: str) -> str:
+    return await _complete(_ai_answer_prompt(question_description, language))
+
+def stream_ai_answer(question_description: str, language: str) -> AsyncIterator[str]:
+    return _stream(_ai_answer_prompt(question_description, language))
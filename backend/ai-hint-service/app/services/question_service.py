@@ -0,0 +1,143 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+QUESTION_SERVICE_URL = os.getenv("QUESTION_SERVICE_URL", "http://question:3002")
+QUESTION_SERVICE_TIMEOUT = float(os.getenv("QUESTION_SERVICE_TIMEOUT", 5))
+# Seconds a description is used without asking the question service again
+QUESTION_CACHE_TTL = float(os.getenv("QUESTION_CACHE_TTL", 10 * 60))
+# Seconds after which an expired description is no longer served while it is being refreshed
+QUESTION_CACHE_STALE_TTL = float(os.getenv("QUESTION_CACHE_STALE_TTL", 24 * 60 * 60))
+QUESTION_CACHE_SIZE = int(os.getenv("QUESTION_CACHE_SIZE", 5000))
+# Load every question at startup, so that even the first request for one needs no round-trip
+QUESTION_PREFETCH = os.getenv("QUESTION_PREFETCH", "true").lower() == "true"
+
+
+class QuestionClient:
+    """
+    Fetches question descriptions from the question service over a pooled connection and caches
+    them. A description younger than `ttl` is returned as is. An older one, up to `stale_ttl`, is
+    returned too and refreshed in the background; it is also returned if the question service
+    cannot be reached. Concurrent fetches of the same question are made once.
+    """
+
+    def __init__(self, base_url: str, timeout: float, ttl: float, stale_ttl: float, size: int):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.size = size
+        self._client: Optional[httpx.AsyncClient] = None
+        # Question ID -> (time fetched, description)
+        self._cache: "OrderedDict[int, Tuple[float, str]]" = OrderedDict()
+        self._fetches: Dict[int, asyncio.Task] = {}
+        # Bumped by invalidate, so that fetches started before do not store what they get
+        self._generations: Dict[int, int] = {}
+
+    async def get_description(self, question_id: int) -> Optional[str]:
+        """The description of the question, or None if it does not exist or could not be fetched."""
+        cached = self._cache.get(question_id)
+        if cached is not None:
+            fetched_at, description = cached
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                self._cache.move_to_end(question_id)
+                return description
+            if age < self.stale_ttl:
+                self._fetch(question_id)
+                return description
+
+        try:
+            # Shielded so that a cancelled request does not cancel the fetch other requests share
+            return await asyncio.shield(self._fetch(question_id))
+        except (httpx.HTTPError, ValueError):
+            return cached[1] if cached is not None else None
+
+    async def prefetch(self, question_ids: Optional[Iterable[int]] = None) -> int:
+        """
+        Caches the descriptions of `question_ids`, or of every question with a single request.
+        Returns how many were cached.
+        """
+        if question_ids is not None:
+            descriptions = await asyncio.gather(*(self.get_description(question_id) for question_id in question_ids))
+            return sum(description is not None for description in descriptions)
+
+        generations = dict(self._generations)
+        response = await self._http().get(f"{self.base_url}/")
+        response.raise_for_status()
+        count = 0
+        for question in response.json():
+            question_id = question.get("questionId")
+            if question_id is None or not question.get("description"):
+                continue
+            if self._generations.get(question_id, 0) == generations.get(question_id, 0):
+                self._store(question_id, question["description"])
+                count += 1
+        return count
+
+    def invalidate(self, question_id: int) -> None:
+        self._cache.pop(question_id, None)
+        self._generations[question_id] = self._generations.get(question_id, 0) + 1
+        # Requests from now on wait for a new fetch; the one in flight still answers its own
+        self._fetches.pop(question_id, None)
+
+    async def close(self) -> None:
+        for task in list(self._fetches.values()):
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+
+    def _fetch(self, question_id: int) -> asyncio.Task:
+        task = self._fetches.get(question_id)
+        if task is None:
+            task = asyncio.ensure_future(self._request(question_id))
+            self._fetches[question_id] = task
+            task.add_done_callback(lambda _: self._fetched(question_id, task))
+        return task
+
+    def _fetched(self, question_id: int, task: asyncio.Task) -> None:
+        if self._fetches.get(question_id) is task:
+            del self._fetches[question_id]
+        # Logged here once, whether requests are waiting for the fetch or it is a background refresh
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Failed to fetch question {question_id}: {task.exception()}")
+
+    async def _request(self, question_id: int) -> Optional[str]:
+        generation = self._generations.get(question_id, 0)
+        response = await self._http().get(f"{self.base_url}/{question_id}")
+        if response.status_code == 404:
+            self._cache.pop(question_id, None)
+            return None
+        response.raise_for_status()
+        description = response.json().get("description")
+        if description and self._generations.get(question_id, 0) == generation:
+            self._store(question_id, description)
+        return description
+
+    def _store(self, question_id: int, description: str) -> None:
+        self._cache[question_id] = (time.monotonic(), description)
+        self._cache.move_to_end(question_id)
+        if len(self._cache) > self.size:
+            self._cache.popitem(last=False)
+
+    def _http(self) -> httpx.AsyncClient:
+        # Created on first use, from within the event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        return self._client
+
+
+question_client = QuestionClient(
+    QUESTION_SERVICE_URL,
+    timeout=QUESTION_SERVICE_TIMEOUT,
+    ttl=QUESTION_CACHE_TTL,
+    stale_ttl=QUESTION_CACHE_STALE_TTL,
+    size=QUESTION_CACHE_SIZE,
+)
@@ -0,0 +1,271 @@
+import os
+import ast
+from typing import Dict, List, Optional, Set
+
+from .code_normalizer import PYTHON
+
+# "off", "prompt" to add what the analysis finds to the prompt of the model, or "answer" to also
+# answer the simplest code without the model
+CODE_ANALYSIS_LOCAL = os.getenv("CODE_ANALYSIS_LOCAL", "prompt").lower()
+
+# Calls that take constant time on the values simple code works with
+_CONSTANT_CALLS = {"range", "len", "print", "abs", "int", "float", "bool"}
+_COMPREHENSIONS = (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+
+class ComplexityFacts:
+    """
+    What the static analysis of Python code found. `answer` is the whole analysis when the code is
+    simple enough to be sure of it: loops over the same size, bounded by a name or the length of
+    one, around assignments and comparisons of loop counters and numeric constants, no arithmetic on
+    anything but numeric constants, and no data allocated or written to.
+    """
+
+    def __init__(self, loop_depth: int, size: Optional[str], self_calls: Dict[str, int],
+                 halving: bool, sorts: bool, simple: bool):
+        self.loop_depth = loop_depth
+        self.size = size
+        self.self_calls = self_calls
+        self.halving = halving
+        self.sorts = sorts
+        self.simple = simple
+
+    def notes(self) -> List[str]:
+        notes = [f"The deepest nesting of loops that depend on the input is {self.loop_depth}."]
+        for name, calls in self.self_calls.items():
+            notes.append(f"Function `{name}` is recursive, with {calls} call(s) to itself in its body.")
+        if self.halving:
+            notes.append("A while loop halves a value on each iteration.")
+        if self.sorts:
+            notes.append("The code sorts, which takes O(n log n) time.")
+        return notes
+
+    @property
+    def answer(self) -> Optional[str]:
+        if not self.simple or CODE_ANALYSIS_LOCAL != "answer":
+            return None
+        if self.loop_depth == 0:
+            time = "O(1)"
+            explanation = "The code has no loops that depend on the size of the input, and no recursion."
+        else:
+            time = "O(n)" if self.loop_depth == 1 else f"O(n^{self.loop_depth})"
+            loops = "a loop" if self.loop_depth == 1 else f"{self.loop_depth} nested loops"
+            where = "" if self.size in (None, "n") else f", where n is {self.size}"
+            explanation = (f"The code has {loops} of up to n iterations{where}, and every iteration does "
+                           f"a constant amount of work.")
+        return (f"Time complexity: {time}\n{explanation}\n\n"
+                f"Space complexity: O(1)\nApart from the input, the code only uses a fixed number of "
+                f"variables and creates no lists, dictionaries, sets or strings.\n\n"
+                f"(Found by static analysis of the loops, without the AI model.)")
+
+
+def analyze(code: str, language: str) -> Optional[ComplexityFacts]:
+    """The facts found in the code, or None if it is not Python that parses or the analysis is off."""
+    if CODE_ANALYSIS_LOCAL == "off" or language.lower() not in PYTHON:
+        return None
+    visitor = _Visitor()
+    try:
+        visitor.visit(ast.parse(code))
+    except (SyntaxError, ValueError, RecursionError):
+        # Also raised for code nested too deeply to parse or walk
+        return None
+    simple = not (visitor.complex or visitor.self_calls or len(visitor.sizes) > 1)
+    return ComplexityFacts(
+        loop_depth=visitor.max_depth,
+        size=next(iter(visitor.sizes), None),
+        self_calls=visitor.self_calls,
+        halving=visitor.halving,
+        sorts=visitor.sorts,
+        simple=simple,
+    )
+
+
+class _Visitor(ast.NodeVisitor):
+    def __init__(self):
+        self.depth = 0
+        self.max_depth = 0
+        # What the loops that depend on the input iterate up to, e.g. "n" or "len(nums)"
+        self.sizes: Set[str] = set()
+        self.self_calls: Dict[str, int] = {}
+        self.halving = False
+        self.sorts = False
+        # Whether anything was seen that the simple analysis cannot account for
+        self.complex = False
+        self._functions: List[str] = []
+        # The variables of the enclosing for loops, and those of them that count through a range
+        self._loop_variables: List[str] = []
+        self._counters: List[str] = []
+
+    def visit_FunctionDef(self, node: ast.AST) -> None:
+        self._functions.append(node.name)
+        # A function may be called from within a loop, which its own loops add to
+        depth, self.depth = self.depth, 0
+        self.generic_visit(node)
+        self.depth = depth
+        self._functions.pop()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_For(self, node: ast.AST) -> None:
+        size = _loop_size(node.iter, self._loop_variables)
+        if size is None:
+            self.complex = True
+            self.visit(node.iter)
+        elif size:
+            self.sizes.add(size)
+        # Otherwise a constant number of iterations
+        variable = node.target.id if isinstance(node.target, ast.Name) else None
+        self._loop_variables.append(variable)
+        counts = _is_range(node.iter)
+        if counts:
+            self._counters.append(variable)
+        if size == "":
+            self._visit_loop_body(node)
+        else:
+            self.depth += 1
+            self.max_depth = max(self.max_depth, self.depth)
+            self._visit_loop_body(node)
+            self.depth -= 1
+        self._loop_variables.pop()
+        if counts:
+            self._counters.pop()
+
+    def _visit_loop_body(self, node: ast.AST) -> None:
+        # The iterable has been checked by _loop_size
+        self.visit(node.target)
+        for child in node.body + node.orelse:
+            self.visit(child)
+
+    visit_AsyncFor = visit_For
+
+    def visit_While(self, node: ast.While) -> None:
+        self.complex = True
+        if any(_halves(child) for child in ast.walk(node)):
+            self.halving = True
+        self._loop(node)
+
+    def _loop(self, node: ast.AST) -> None:
+        self.depth += 1
+        self.max_depth = max(self.max_depth, self.depth)
+        self.generic_visit(node)
+        self.depth -= 1
+
+    def visit_Call(self, node: ast.Call) -> None:
+        name = node.func.id if isinstance(node.func, ast.Name) else None
+        method = node.func.attr if isinstance(node.func, ast.Attribute) else None
+        if name == "sorted" or method == "sort":
+            self.sorts = True
+        if method is not None and isinstance(node.func.value, ast.Name) and node.func.value.id == "self":
+            called = method
+        else:
+            called = name
+        if called is not None and called in self._functions[-1:]:
+            self.self_calls[called] = self.self_calls.get(called, 0) + 1
+        if name not in _CONSTANT_CALLS:
+            self.complex = True
+        # print(*nums) takes time with the size of nums
+        if (any(isinstance(arg, ast.Starred) for arg in node.args)
+                or any(keyword.arg is None for keyword in node.keywords)):
+            self.complex = True
+        self.generic_visit(node)
+
+    def visit_Compare(self, node: ast.Compare) -> None:
+        # a == b compares lists or strings element by element, only numbers compare in constant time
+        if not all(self._is_counter_or_number(operand) for operand in [node.left, *node.comparators]):
+            self.complex = True
+        self.generic_visit(node)
+
+    def _is_counter_or_number(self, expr: ast.expr) -> bool:
+        return _is_number(expr) or isinstance(expr, ast.Name) and expr.id in self._counters
+
+    def visit_Slice(self, node: ast.Slice) -> None:
+        self.complex = True
+        self.generic_visit(node)
+
+    def visit_Subscript(self, node: ast.Subscript) -> None:
+        # Writing to a list or dictionary may grow it
+        if not isinstance(node.ctx, ast.Load):
+            self.complex = True
+        self.generic_visit(node)
+
+    def visit_BinOp(self, node: ast.BinOp) -> None:
+        # a * n or r + s take time and space with the size of sequences and strings
+        if not (_is_number(node.left) and _is_number(node.right)):
+            self.complex = True
+        self.generic_visit(node)
+
+    def visit_AugAssign(self, node: ast.AugAssign) -> None:
+        if not _is_number(node.value):
+            self.complex = True
+        self.generic_visit(node)
+
+    def visit_Constant(self, node: ast.Constant) -> None:
+        if isinstance(node.value, (str, bytes)):
+            self.complex = True
+
+    def generic_visit(self, node: ast.AST) -> None:
+        if isinstance(node, (ast.List, ast.Set, ast.Dict, ast.Lambda, ast.Import, ast.ImportFrom,
+                             ast.Yield, ast.YieldFrom, ast.Global, ast.Nonlocal) + _COMPREHENSIONS):
+            self.complex = True
+        super().generic_visit(node)
+
+
+def _loop_size(iterable: ast.expr, loop_variables: List[Optional[str]]) -> Optional[str]:
+    """
+    What a for loop iterates up to: "" for a constant, the name or `len(name)` of the size, or None
+    when it cannot tell. A range may only start from a constant or from the variable of an
+    enclosing loop, as in range(i + 1, n), so that it is up to the size that it iterates.
+    """
+    if _is_range(iterable):
+        args = iterable.args
+        if not args or len(args) > 3:
+            return None
+        if all(isinstance(arg, ast.Constant) for arg in args):
+            return ""
+        if len(args) == 3 and not _is_number(args[2]):
+            return None
+        if len(args) > 1 and not _is_start(args[0], loop_variables):
+            return None
+        return _size_of(args[1] if len(args) > 1 else args[0])
+    if isinstance(iterable, (ast.Tuple, ast.List)) and all(isinstance(elt, ast.Constant) for elt in iterable.elts):
+        return ""
+    if isinstance(iterable, ast.Name):
+        return f"len({iterable.id})"
+    return None
+
+
+def _is_range(iterable: ast.expr) -> bool:
+    return isinstance(iterable, ast.Call) and isinstance(iterable.func, ast.Name) and iterable.func.id == "range"
+
+
+def _size_of(expr: ast.expr) -> Optional[str]:
+    if isinstance(expr, ast.Name):
+        return expr.id
+    if (isinstance(expr, ast.Call) and isinstance(expr.func, ast.Name) and expr.func.id == "len"
+            and len(expr.args) == 1 and isinstance(expr.args[0], ast.Name)):
+        return f"len({expr.args[0].id})"
+    # n + 1, len(nums) - 1, ...
+    if isinstance(expr, ast.BinOp) and isinstance(expr.op, (ast.Add, ast.Sub)) and isinstance(expr.right, ast.Constant):
+        return _size_of(expr.left)
+    return None
+
+
+def _is_number(expr: ast.expr) -> bool:
+    return isinstance(expr, ast.Constant) and isinstance(expr.value, (int, float))
+
+
+def _is_start(expr: ast.expr, loop_variables: List[Optional[str]]) -> bool:
+    if _is_number(expr):
+        return True
+    if isinstance(expr, ast.BinOp) and isinstance(expr.op, (ast.Add, ast.Sub)) and _is_number(expr.right):
+        expr = expr.left
+    return isinstance(expr, ast.Name) and expr.id in loop_variables
+
+
+def _halves(node: ast.AST) -> bool:
+    if isinstance(node, ast.AugAssign):
+        return isinstance(node.op, (ast.FloorDiv, ast.RShift)) and isinstance(node.value, ast.Constant)
+    if isinstance(node, ast.BinOp):
+        return (isinstance(node.op, ast.FloorDiv) and isinstance(node.right, ast.Constant) and node.right.value == 2
+                or isinstance(node.op, ast.RShift) and isinstance(node.right, ast.Constant) and node.right.value == 1)
+    return False
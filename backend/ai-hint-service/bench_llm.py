@@ -0,0 +1,178 @@
+"""
+Throughput of the AI hint service under concurrent users, against stub completion and question
+services that answer after a fixed delay, so that only the service itself is measured.
+
+Usage: python bench_llm.py [--endpoint hint] [--users 100] [--duration 10] [--latency 0.5] [--stream]
+
+With --stream, the streaming endpoints are used and the time to the first token is reported too;
+the stub model then writes its answer in --tokens chunks over --latency seconds.
+
+Every request asks about a different question, so none is answered from the response cache. The
+service is started with uvicorn on --port, pointed at the stubs, with the environment of this
+process (e.g. OPENAI_MAX_CONCURRENCY). Pass --url to drive a service that is already running
+instead; it must then use the stubs (OPENAI_BASE_URL=http://localhost:<stub-port>/v1 and
+QUESTION_SERVICE_URL=http://localhost:<stub-port + 1>).
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import subprocess
+from collections import Counter
+from itertools import count
+
+import httpx
+import uvicorn
+
+_question_ids = count(1)
+
+
+def _stub_completions(latency: float, tokens: int):
+    """
+    POST /v1/chat/completions: a fixed answer of `tokens` chunks after `latency` seconds, or
+    streamed one chunk every `latency / tokens` seconds.
+    """
+    words = [f"word{i} " for i in range(tokens)]
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        if not json.loads(body).get("stream"):
+            await asyncio.sleep(latency)
+            await _respond(send, 200, {
+                "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()),
+                "model": "bench", "choices": [{"index": 0, "finish_reason": "stop", "message": {
+                    "role": "assistant", "content": "".join(words)}}],
+            })
+            return
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream")]})
+        for word in words:
+            await asyncio.sleep(latency / tokens)
+            chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": "bench", "choices": [{"index": 0, "finish_reason": None, "delta": {"content": word}}]}
+            await send({"type": "http.response.body", "body": f"data: {json.dumps(chunk)}\n\n".encode(),
+                        "more_body": True})
+        await send({"type": "http.response.body", "body": b"data: [DONE]\n\n"})
+    return app
+
+
+async def _stub_question_service(scope, receive, send):
+    """GET /<id>: every question exists. GET /, the list of all of them, is empty."""
+    if scope["type"] != "http":
+        return
+    if scope["path"] == "/":
+        await _respond(send, 200, [])
+        return
+    await _respond(send, 200, {"description": f"Question {scope['path'].strip('/')}: find two numbers."})
+
+
+async def _respond(send, status: int, body) -> None:
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": json.dumps(body).encode()})
+
+
+def _request(client: httpx.AsyncClient, url: str, endpoint: str, stream: bool):
+    suffix = "stream" if stream else ""
+    if endpoint == "hint":
+        return client.stream("GET", f"{url}/api/hint/{next(_question_ids)}/{suffix}".rstrip("/"))
+    # The code differs per request, as it would between users
+    return client.stream("POST", f"{url}/api/code-analysis/{suffix}", json={
+        "code": f"def solve(nums):\n    return sorted(nums)[{next(_question_ids)}]", "language": "python"})
+
+
+async def _run(url: str, endpoint: str, users: int, duration: float, stream: bool) -> None:
+    latencies = []
+    first_tokens = []
+    statuses = Counter()
+    deadline = time.perf_counter() + duration
+
+    async def user(client: httpx.AsyncClient):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                async with _request(client, url, endpoint, stream) as response:
+                    first_token = None
+                    async for line in response.aiter_lines():
+                        if line == "event: token" and first_token is None:
+                            first_token = time.perf_counter() - start
+                        elif line == "event: error":
+                            statuses["error event"] += 1
+                statuses[response.status_code] += 1
+                if first_token is not None:
+                    first_tokens.append(first_token)
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(user(client) for _ in range(users)))
+        elapsed = time.perf_counter() - start
+
+    print(f"{endpoint}{' (streamed)' if stream else ''}: {users} users, {len(latencies)} requests in {elapsed:.1f}s")
+    print(f"  {len(latencies) / elapsed:.1f} req/s, p50 {_percentile(latencies, 50):.0f} ms, "
+          f"p99 {_percentile(latencies, 99):.0f} ms")
+    if stream:
+        print(f"  first token p50 {_percentile(first_tokens, 50):.0f} ms, p99 {_percentile(first_tokens, 99):.0f} ms")
+    print(f"  responses: {dict(statuses)}")
+
+
+def _percentile(values: list, percentile: int) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * percentile // 100)] * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--endpoint", choices=("hint", "code-analysis"), default="hint")
+    parser.add_argument("--users", type=int, default=100, help="concurrent users, one request at a time each")
+    parser.add_argument("--duration", type=float, default=10, help="seconds to run for")
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds the stub model takes to answer")
+    parser.add_argument("--tokens", type=int, default=20, help="chunks in an answer of the stub model")
+    parser.add_argument("--stream", action="store_true", help="use the streaming endpoints")
+    parser.add_argument("--port", type=int, default=3925)
+    parser.add_argument("--stub-port", type=int, default=3921)
+    parser.add_argument("--url", help="drive a running service instead of starting one")
+    args = parser.parse_args()
+
+    stubs = [uvicorn.Server(uvicorn.Config(app, port=args.stub_port + i, log_level="warning"))
+             for i, app in enumerate((_stub_completions(args.latency, args.tokens), _stub_question_service))]
+    stub_tasks = [asyncio.create_task(stub.serve()) for stub in stubs]
+    server = None
+    url = args.url
+    if url is None:
+        env = dict(os.environ, OPENAI_BASE_URL=f"http://localhost:{args.stub_port}/v1", OPENAI_API_KEY="bench",
+                   QUESTION_SERVICE_URL=f"http://localhost:{args.stub_port + 1}")
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.port), "--log-level", "warning"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+        url = f"http://localhost:{args.port}"
+    await asyncio.sleep(2)
+
+    try:
+        await _run(url, args.endpoint, args.users, args.duration, args.stream)
+    finally:
+        if server is not None:
+            server.terminate()
+            # The stubs run on this loop and must keep answering while the service shuts down
+            await asyncio.get_running_loop().run_in_executor(None, server.wait)
+        for stub in stubs:
+            stub.should_exit = True
+        await asyncio.gather(*stub_tasks)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
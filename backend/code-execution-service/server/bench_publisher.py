@@ -0,0 +1,77 @@
+"""
+Submits per second of the old publisher (a new blocking connection per message) against the
+shared confirm-mode publisher. Needs a running RabbitMQ, configured like the server (.env).
+
+Usage: python bench_publisher.py [messages] [concurrency]
+
+Messages are published to a throwaway queue, not to the one the workers consume.
+"""
+import os
+import sys
+import time
+import json
+import asyncio
+import pika
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import rabbitmq
+from rabbitmq import Publisher
+
+rabbitmq.QUEUE = 'code-execution-bench'
+MESSAGE = json.dumps({"id": "bench", "code": "print(input())", "input": "1", "timeout": 1, "lang": "python"})
+
+
+def _send_message_per_connection(message: str) -> None:
+    # What every submission used to do
+    connection = pika.BlockingConnection(pika.ConnectionParameters(
+        host=os.environ.get('RABBITMQ_HOST'), port=os.environ.get('RABBITMQ_PORT'), heartbeat=30))
+    channel = connection.channel()
+    channel.queue_declare(queue=rabbitmq.QUEUE, durable=True)
+    channel.basic_publish(exchange='', routing_key=rabbitmq.QUEUE, body=message,
+                          properties=pika.BasicProperties(delivery_mode=pika.DeliveryMode.Persistent))
+    connection.close()
+
+
+async def _bench_old(messages: int, concurrency: int) -> float:
+    # The old handler blocked the event loop, so concurrent requests were effectively serialised
+    start = time.perf_counter()
+    for _ in range(messages):
+        _send_message_per_connection(MESSAGE)
+    return messages / (time.perf_counter() - start)
+
+
+async def _bench_new(messages: int, concurrency: int) -> float:
+    publisher = Publisher(int(os.environ.get('RABBITMQ_PUBLISHER_CHANNELS', 4)))
+    await publisher.connect()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def submit():
+        async with semaphore:
+            await publisher.publish(MESSAGE)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(submit() for _ in range(messages)))
+    rate = messages / (time.perf_counter() - start)
+    await publisher.close()
+    return rate
+
+
+async def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    old = await _bench_old(messages, concurrency)
+    new = await _bench_new(messages, concurrency)
+    print(f"connection per message: {old:>10.1f} submits/s")
+    print(f"shared publisher:       {new:>10.1f} submits/s ({new / old:.1f}x)")
+
+    connection = pika.BlockingConnection(pika.ConnectionParameters(
+        host=os.environ.get('RABBITMQ_HOST'), port=os.environ.get('RABBITMQ_PORT')))
+    connection.channel().queue_delete(queue=rabbitmq.QUEUE)
+    connection.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
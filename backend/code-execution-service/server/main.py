@@ -1,18 +1,37 @@
 from fastapi import FastAPI, status, HTTPException, Depends
 from models import CodeExecutionRequest
 import json
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from typing import Annotated
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from rabbitmq import send_message
-from redis_model import register_task, get_task
+from rabbitmq import send_message, publisher
+from redis_model import register_task, get_task, get_partial_output, listen_for_finished_tasks, wait_for_task
 from user import UserAuthentication
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    listener = asyncio.create_task(listen_for_finished_tasks())
+    try:
+        await publisher.connect()
+    except Exception as e:
+        # The first submission will try again
+        logging.error(f"Failed to connect to RabbitMQ: {e}")
+    yield
+    listener.cancel()
+    await publisher.close()
+    await authentication.verifier.close()
+
+
+app = FastAPI(lifespan=lifespan)
 languages = ["python", "javascript", "typescript", "java", "c", "cpp"]
+max_test_cases = 100
+max_wait_timeout = 60
 authentication = UserAuthentication()
 
 
@@ -20,6 +39,11 @@ authentication = UserAuthentication()
 async def get_supported_languages():
     return {"languages": languages}
 
+@app.get("/stats/auth")
+async def get_auth_stats():
+    """Token cache hit rate and user service latency."""
+    return authentication.verifier.stats()
+
 @app.post("/")
 async def execute_code(
     current_user: Annotated[dict, Depends(authentication)],
@@ -31,14 +55,25 @@ async def execute_code(
     if body.timeout < 1 or body.timeout > 10:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid timeout, must be between 1 and 10")
+    if body.inputs is not None and not 1 <= len(body.inputs) <= max_test_cases:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid inputs, must have between 1 and {max_test_cases} test cases")
+    if body.expected_outputs is not None and (body.inputs is None or len(body.expected_outputs) != len(body.inputs)):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid expected_outputs, must match inputs")
     id = register_task()
-    send_message(json.dumps({
+    message = {
         "id": id,
         "code": body.code,
         "input": body.input,
         "timeout": body.timeout,
         "lang": body.lang,
-    }))
+    }
+    if body.inputs is not None:
+        message["inputs"] = body.inputs
+        message["expected_outputs"] = body.expected_outputs
+        message["stop_on_failure"] = body.stop_on_failure
+    await send_message(json.dumps(message))
     return {"id": id}
 
 @app.get("/")
@@ -50,9 +85,40 @@ async def check_status(
     if not task:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
+    return _task_status(id, task)
+
+@app.get("/wait")
+async def wait_for_result(
+    current_user: Annotated[dict, Depends(authentication)],
+    id: str,
+    timeout: float = 30,
+):
+    """
+    Long-poll variant of `GET /`: responds as soon as the task finishes, or with its current
+    status after `timeout` seconds.
+    """
+    if timeout <= 0 or timeout > max_wait_timeout:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid timeout, must be between 0 and {max_wait_timeout}")
+    task = await wait_for_task(id, timeout)
+    if not task:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
+    return _task_status(id, task)
+
+def _task_status(id: str, task: dict) -> dict:
     if not task["started"]:
         return {"status": "queued"}
     elif not task["finished"]:
-        return {"status": "running"}
+        output, error = get_partial_output(id)
+        return {"status": "running", "output": output, "error": error}
     else:
-        return {"status": "finished", "output": task["output"], "error": task["error"]}
+        return {
+            "status": "finished",
+            "output": task["output"],
+            "error": task["error"],
+            "compile_cache_hit": task.get("compile_cache_hit"),
+            "truncated": task.get("truncated", False),
+            "usage": task.get("usage"),
+            "cases": task.get("cases"),
+        }
@@ -4,5 +4,9 @@ from pydantic import BaseModel
 class CodeExecutionRequest(BaseModel):
     code: str
     lang: str
-    input: str
+    input: str = ""
     timeout: int
+    # Batch mode: compile once and run every input, comparing against the expected outputs when given
+    inputs: list[str] | None = None
+    expected_outputs: list[str | None] | None = None
+    stop_on_failure: bool = False
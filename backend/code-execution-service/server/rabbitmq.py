@@ -1,14 +1,54 @@
-import pika
+import aio_pika
+from aio_pika.pool import Pool
 import os
+import asyncio
 
-def _get_channel():
-    connection = pika.BlockingConnection(pika.ConnectionParameters(
-        host=os.environ.get('RABBITMQ_HOST'), port=os.environ.get('RABBITMQ_PORT'), heartbeat=30))
-    channel = connection.channel()
-    channel.queue_declare(queue='code-execution', durable=True)
-    return channel
+QUEUE = 'code-execution'
+publisher_channels = int(os.environ.get('RABBITMQ_PUBLISHER_CHANNELS', 4))
 
 
-def send_message(message: str) -> None:
-    _get_channel().basic_publish(exchange='', routing_key='code-execution', body=message,
-                          properties=pika.BasicProperties(delivery_mode=pika.DeliveryMode.Persistent))
+class Publisher:
+    """
+    One long-lived connection, shared by every request, that reconnects by itself if the broker goes
+    away. Messages are published on a small pool of channels in confirm mode: publishes are pipelined
+    and the broker acknowledges them in batches, and `publish` only returns once the message is
+    safely queued.
+    """
+
+    def __init__(self, max_channels: int):
+        self._connection: aio_pika.abc.AbstractRobustConnection | None = None
+        self._channels = Pool(self._open_channel, max_size=max_channels)
+        self._lock = asyncio.Lock()
+
+    async def connect(self) -> None:
+        async with self._lock:
+            if self._connection is not None:
+                return
+            self._connection = await aio_pika.connect_robust(
+                host=os.environ.get('RABBITMQ_HOST'), port=int(os.environ.get('RABBITMQ_PORT')), heartbeat=30)
+            async with self._channels.acquire() as channel:
+                await channel.declare_queue(QUEUE, durable=True)
+
+    async def close(self) -> None:
+        await self._channels.close()
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+    async def publish(self, message: str) -> None:
+        if self._connection is None:
+            await self.connect()
+        async with self._channels.acquire() as channel:
+            await channel.default_exchange.publish(
+                aio_pika.Message(body=message.encode(), delivery_mode=aio_pika.DeliveryMode.PERSISTENT),
+                routing_key=QUEUE)
+
+    async def _open_channel(self) -> aio_pika.abc.AbstractChannel:
+        return await self._connection.channel(publisher_confirms=True)
+
+
+publisher = Publisher(publisher_channels)
+
+
+async def send_message(message: str) -> None:
+    await publisher.publish(message)
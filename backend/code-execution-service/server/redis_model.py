@@ -1,20 +1,114 @@
 import redis
+from redis import asyncio as aioredis
 import os
 import uuid
 import json
+import asyncio
+import logging
 
 pool = redis.ConnectionPool(host=os.environ.get("REDIS_HOST"),
                             port=os.environ.get("REDIS_PORT"),
                             db=0)
 r = redis.Redis(connection_pool=pool)
+# Unfinished tasks expire too, in case a worker never picks them up
+task_ttl = int(os.environ.get("TASK_TTL", 24 * 60 * 60))
+async_r = aioredis.Redis(host=os.environ.get("REDIS_HOST"),
+                         port=os.environ.get("REDIS_PORT"),
+                         db=0)
+
+# Published by the worker's finish_task with the id of the task
+TASK_FINISHED_CHANNEL = "code-execution:finished"
+# Futures of the requests waiting for each task to finish
+_waiters: dict[str, set[asyncio.Future]] = {}
+
+# Tasks are hashes with one JSON-encoded value per field, so that each field can be written on its own
 
 def register_task() -> str:
     task_id = str(uuid.uuid4())
-    r.set(task_id, json.dumps({"started": False, "finished": False, "output": ""}))
+    fields = {"started": False, "finished": False, "output": ""}
+    with r.pipeline() as pipe:
+        pipe.hset(task_id, mapping={field: json.dumps(value) for field, value in fields.items()})
+        pipe.expire(task_id, task_ttl)
+        pipe.execute()
     return task_id
 
-def get_task(task_id: str) -> dict:
-    task = r.get(task_id)
+def get_task(task_id: str) -> dict | None:
+    try:
+        return _decode_task(r.hgetall(task_id))
+    except redis.ResponseError as e:
+        if not _is_legacy(e):
+            raise
+        return _decode_legacy_task(r.get(task_id))
+
+def get_partial_output(task_id: str) -> tuple[str, str]:
+    """Output a running task has produced so far, as published by the worker."""
+    output = {b"stdout": b"", b"stderr": b""}
+    for _, entry in r.xrange(f"{task_id}:output"):
+        output[entry[b"stream"]] += entry[b"data"]
+    return output[b"stdout"].decode(errors="replace"), output[b"stderr"].decode(errors="replace")
+
+async def listen_for_finished_tasks() -> None:
+    """
+    Wakes up the requests waiting in `wait_for_task`. A single subscription is shared by every waiter,
+    so the number of Redis connections does not grow with the number of clients.
+    """
+    while True:
+        pubsub = async_r.pubsub()
+        try:
+            await pubsub.subscribe(TASK_FINISHED_CHANNEL)
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                for future in _waiters.pop(message["data"].decode(), ()):
+                    if not future.done():
+                        future.set_result(None)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Waiters time out and re-read the task, so a missed notification only delays them
+            logging.error(f"Lost subscription to {TASK_FINISHED_CHANNEL}, reconnecting: {e}")
+            await asyncio.sleep(1)
+        finally:
+            # Give the connection back, or every reconnect would leak one
+            await pubsub.aclose()
+
+async def wait_for_task(task_id: str, timeout: float) -> dict | None:
+    """Returns the task once it has finished, or as it is after `timeout` seconds."""
+    future = asyncio.get_running_loop().create_future()
+    _waiters.setdefault(task_id, set()).add(future)
+    try:
+        # Only read the task after registering, so a task finishing in between is not missed
+        task = await _get_task_async(task_id)
+        if task is None or task["finished"]:
+            return task
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        return await _get_task_async(task_id)
+    finally:
+        waiters = _waiters.get(task_id)
+        if waiters is not None:
+            waiters.discard(future)
+            if not waiters:
+                del _waiters[task_id]
+
+async def _get_task_async(task_id: str) -> dict | None:
+    try:
+        return _decode_task(await async_r.hgetall(task_id))
+    except redis.ResponseError as e:
+        if not _is_legacy(e):
+            raise
+        return _decode_legacy_task(await async_r.get(task_id))
+
+def _is_legacy(error: redis.ResponseError) -> bool:
+    # Tasks registered before they were hashes are JSON strings until a worker updates them
+    return str(error).startswith("WRONGTYPE")
+
+def _decode_legacy_task(task: bytes | None) -> dict | None:
+    return json.loads(task) if task else None
+
+def _decode_task(task: dict[bytes, bytes]) -> dict | None:
     if not task:
         return None
-    return json.loads(task)
+    return {field.decode(): json.loads(value) for field, value in task.items()}
@@ -1,13 +1,115 @@
 from fastapi import Request, HTTPException, status
 from fastapi.security.utils import get_authorization_scheme_param
+from collections import OrderedDict
 import os
-import requests
+import time
+import asyncio
+import hashlib
+import httpx
 
 
 user_service_url = os.environ.get("USER_SERVICE_URL")
+auth_cache_ttl = float(os.environ.get("AUTH_CACHE_TTL", 60))
+auth_cache_size = int(os.environ.get("AUTH_CACHE_SIZE", 10000))
+
+
+class TokenVerifier:
+    """
+    Verifies tokens against the user service over a pooled async client. Valid tokens are kept in a
+    TTL-bounded LRU cache, and concurrent checks of the same token share a single upstream call.
+
+    Also in collaboration-service/user_verification.py: each service is built into its own image from its own
+    directory, so there is no package to share it through. Keep the two copies in sync.
+    """
+
+    def __init__(self, url: str, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._client = httpx.AsyncClient(base_url=url, timeout=5)
+        self._cache: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._stats = {"hits": 0, "misses": 0, "shared": 0, "upstream_calls": 0,
+                       "upstream_errors": 0, "upstream_seconds": 0.0, "upstream_max_seconds": 0.0}
+
+    async def verify(self, authorization: str) -> dict | None:
+        """Returns the user for the given Authorization header value, or None if it is not valid."""
+        # Only keep a digest of the token in memory
+        key = hashlib.sha256(authorization.encode()).hexdigest()
+        cached = self._cache.get(key)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                self._cache.move_to_end(key)
+                self._stats["hits"] += 1
+                return cached[1]
+            del self._cache[key]
+        self._stats["misses"] += 1
+
+        task = self._inflight.get(key)
+        if task is None:
+            # A task of its own, so that cancelling the caller that started it cancels no one else
+            task = asyncio.ensure_future(self._fetch_and_cache(key, authorization))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._fetched(key, task))
+        else:
+            self._stats["shared"] += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        calls = self._stats["upstream_calls"]
+        return {
+            "cache_size": len(self._cache),
+            "hits": self._stats["hits"],
+            "misses": self._stats["misses"],
+            "hit_rate": self._stats["hits"] / lookups if lookups else None,
+            "shared_upstream_calls": self._stats["shared"],
+            "upstream_calls": calls,
+            "upstream_errors": self._stats["upstream_errors"],
+            "upstream_mean_ms": self._stats["upstream_seconds"] / calls * 1000 if calls else None,
+            "upstream_max_ms": self._stats["upstream_max_seconds"] * 1000,
+        }
+
+    async def close(self) -> None:
+        for task in list(self._inflight.values()):
+            task.cancel()
+        await self._client.aclose()
+
+    async def _fetch_and_cache(self, key: str, authorization: str) -> dict | None:
+        user = await self._fetch(authorization)
+        if user is not None:
+            self._cache[key] = (time.monotonic() + self.ttl, user)
+            if len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return user
+
+    def _fetched(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Make sure the exception is retrieved even if every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    async def _fetch(self, authorization: str) -> dict | None:
+        start = time.perf_counter()
+        try:
+            response = await self._client.get("/auth/verify-token", headers={"Authorization": authorization})
+        except httpx.HTTPError:
+            self._stats["upstream_errors"] += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self._stats["upstream_calls"] += 1
+            self._stats["upstream_seconds"] += elapsed
+            self._stats["upstream_max_seconds"] = max(self._stats["upstream_max_seconds"], elapsed)
+        if response.status_code != 200:
+            return None
+        return response.json().get("data")
 
 
 class UserAuthentication:
+    def __init__(self):
+        self.verifier = TokenVerifier(user_service_url, auth_cache_ttl, auth_cache_size)
+
     def _get_token(self, request: Request) -> str:
         authorization = request.headers.get("Authorization")
         scheme, token = get_authorization_scheme_param(authorization)
@@ -15,17 +117,14 @@ class UserAuthentication:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
         return token
-    
-    def _verify_token(self, token: str) -> dict:
-        response = requests.get(f"{user_service_url}/auth/verify-token", headers={
-            "Authorization": f"Bearer {token}"
-        })
-        data = response.json().get("data")
+
+    async def _verify_token(self, token: str) -> dict:
+        data = await self.verifier.verify(f"Bearer {token}")
         if not data:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
         return data
-    
-    def __call__(self, request: Request) -> dict:
+
+    async def __call__(self, request: Request) -> dict:
         token = self._get_token(request)
-        return self._verify_token(token)
+        return await self._verify_token(token)
@@ -0,0 +1,55 @@
+"""
+Compares warm (pre-spawned) and cold start latency for each runtime.
+
+Usage: RUNTIME_POOL_SIZE=1 python bench_runtime_pool.py [runs] [pause seconds]
+"""
+import os
+import sys
+import time
+import logging
+
+from runtime_pool import pool
+from execute import execute
+
+logging.basicConfig(level=logging.WARNING)
+
+PROGRAMS = {
+    "python": "print(input())",
+    "javascript": "console.log(require('fs').readFileSync(0, 'utf8'))",
+    "typescript": "const line: string = require('fs').readFileSync(0, 'utf8');\nconsole.log(line);",
+    "java": "public class Solution { public static void main(String[] args) { System.out.println(new java.util.Scanner(System.in).nextLine()); } }",
+}
+
+
+def _bench(runs: int, pause: float) -> dict[str, float]:
+    results = {}
+    for lang, code in PROGRAMS.items():
+        total = 0.0
+        for _ in range(runs):
+            # Submissions do not arrive back to back, give the pool time to refill
+            time.sleep(pause)
+            start = time.perf_counter()
+            execute(code, lang, "hello\n", 10)
+            total += time.perf_counter() - start
+        results[lang] = total / runs * 1000
+    return results
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    pause = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    os.makedirs("temp", exist_ok=True)
+
+    cold = _bench(runs, pause)
+    pool.start()
+    warm = _bench(runs, pause)
+    pool.close()
+
+    print(f"{'language':<12}{'cold ms':>10}{'warm ms':>10}{'speedup':>10}")
+    for lang in PROGRAMS:
+        print(f"{lang:<12}{cold[lang]:>10.1f}{warm[lang]:>10.1f}{cold[lang] / warm[lang]:>9.1f}x")
+    print(pool.latency_report())
+
+
+if __name__ == "__main__":
+    main()
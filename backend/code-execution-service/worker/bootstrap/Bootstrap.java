@@ -0,0 +1,35 @@
+import java.io.BufferedReader;
+import java.io.File;
+import java.io.FileInputStream;
+import java.io.InputStreamReader;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.URL;
+import java.net.URLClassLoader;
+
+public class Bootstrap {
+    public static void main(String[] args) throws Throwable {
+        String cwd;
+        String classPath;
+        try (BufferedReader control = new BufferedReader(
+                new InputStreamReader(new FileInputStream("/proc/self/fd/" + args[0])))) {
+            cwd = control.readLine();
+            classPath = control.readLine();
+        }
+        if (cwd == null || classPath == null) {
+            System.exit(1);
+        }
+
+        // The JVM cannot change its working directory, so resolve the class path against it instead
+        URLClassLoader loader = new URLClassLoader(
+                new URL[] { new File(cwd, classPath).toURI().toURL() },
+                ClassLoader.getPlatformClassLoader());
+        Thread.currentThread().setContextClassLoader(loader);
+        Method main = loader.loadClass("Solution").getMethod("main", String[].class);
+        try {
+            main.invoke(null, (Object) new String[0]);
+        } catch (InvocationTargetException e) {
+            throw e.getCause();
+        }
+    }
+}
@@ -0,0 +1,23 @@
+const fs = require("fs");
+const path = require("path");
+const Module = require("module");
+
+function readTarget(fd) {
+  const buffer = Buffer.alloc(4096);
+  let data = "";
+  let n;
+  while ((n = fs.readSync(fd, buffer, 0, buffer.length, null)) > 0) {
+    data += buffer.toString("utf8", 0, n);
+  }
+  fs.closeSync(fd);
+  const lines = data.split("\n");
+  if (lines.length < 2) {
+    process.exit(1);
+  }
+  process.chdir(lines[0]);
+  return lines[1];
+}
+
+const script = path.resolve(readTarget(Number(process.argv[2])));
+process.argv = [process.argv[0], script];
+Module.runMain(script);
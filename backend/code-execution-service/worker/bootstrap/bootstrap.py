@@ -0,0 +1,32 @@
+import os
+import sys
+import runpy
+import traceback
+
+
+def _read_target(fd: int) -> tuple[str, str]:
+    data = b""
+    while chunk := os.read(fd, 4096):
+        data += chunk
+    os.close(fd)
+    lines = data.decode().split("\n")
+    if len(lines) < 2:
+        sys.exit(1)
+    return lines[0], lines[1]
+
+
+cwd, path = _read_target(int(sys.argv[1]))
+os.chdir(cwd)
+sys.argv = [path]
+sys.path[0] = os.path.dirname(os.path.abspath(path))
+try:
+    runpy.run_path(path, run_name="__main__")
+except SystemExit:
+    raise
+except BaseException as e:
+    # Hide the bootstrap and runpy frames so the traceback matches a cold `python solution.py`
+    tb = e.__traceback__
+    while tb is not None and tb.tb_frame.f_code.co_filename != path:
+        tb = tb.tb_next
+    traceback.print_exception(type(e), e, tb)
+    sys.exit(1)
@@ -0,0 +1,80 @@
+/*
+ * Runs a command and reports the peak RSS of the process it became, in kilobytes, on the file
+ * descriptor given as the first argument. The ru_maxrss of a process forked from the worker
+ * includes everything the worker had touched before the fork, so the worker starts this small
+ * program instead, and it forks the command.
+ *
+ * Usage: peak_rss <fd> <command> [<argument>...]
+ *
+ * Exits like the command did. SIGTERM kills the command, whose peak RSS is still reported.
+ */
+#include <errno.h>
+#include <signal.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/prctl.h>
+#include <sys/resource.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+static volatile pid_t child;
+
+static void kill_child(int signal) {
+    (void) signal;
+    if (child > 0) {
+        kill(child, SIGKILL);
+    }
+}
+
+int main(int argc, char **argv) {
+    if (argc < 3) {
+        fprintf(stderr, "usage: %s <fd> <command> [<argument>...]\n", argv[0]);
+        return 2;
+    }
+    int fd = atoi(argv[1]);
+    pid_t parent = getpid();
+
+    struct sigaction action;
+    memset(&action, 0, sizeof action);
+    action.sa_handler = kill_child;
+    sigaction(SIGTERM, &action, NULL);
+
+    child = fork();
+    if (child < 0) {
+        perror("fork");
+        return 1;
+    }
+    if (child == 0) {
+        /* The worker kills this process, so the command must not outlive it */
+        prctl(PR_SET_PDEATHSIG, SIGKILL);
+        if (getppid() != parent) {
+            _exit(1);
+        }
+        close(fd);
+        execvp(argv[2], argv + 2);
+        perror(argv[2]);
+        _exit(127);
+    }
+
+    int status;
+    struct rusage usage;
+    while (wait4(child, &status, 0, &usage) < 0) {
+        if (errno != EINTR) {
+            perror("wait4");
+            return 1;
+        }
+    }
+    dprintf(fd, "%ld\n", usage.ru_maxrss);
+    close(fd);
+
+    if (WIFSIGNALED(status)) {
+        /* Die of the same signal, without dumping core for SIGXCPU */
+        struct rlimit no_core = {0, 0};
+        setrlimit(RLIMIT_CORE, &no_core);
+        signal(WTERMSIG(status), SIG_DFL);
+        kill(getpid(), WTERMSIG(status));
+    }
+    return WIFEXITED(status) ? WEXITSTATUS(status) : 1;
+}
@@ -0,0 +1,63 @@
+const fs = require("fs");
+const ts = require("typescript");
+
+const WARMUP_FILE = "__warmup__.ts";
+
+function readTarget(fd) {
+  const buffer = Buffer.alloc(4096);
+  let data = "";
+  let n;
+  while ((n = fs.readSync(fd, buffer, 0, buffer.length, null)) > 0) {
+    data += buffer.toString("utf8", 0, n);
+  }
+  fs.closeSync(fd);
+  const lines = data.split("\n");
+  if (lines.length < 2) {
+    process.exit(1);
+  }
+  process.chdir(lines[0]);
+  return lines[1];
+}
+
+// Same defaults as a bare `tsc solution.ts`
+const options = {};
+const host = ts.createCompilerHost(options);
+// The default host memoizes the working directory, but we chdir into the task directory later
+host.getCurrentDirectory = () => process.cwd();
+const getSourceFile = host.getSourceFile;
+const libDir = host.getDefaultLibLocation();
+const libCache = new Map();
+host.getSourceFile = (fileName, languageVersion, onError) => {
+  if (fileName === WARMUP_FILE) {
+    return ts.createSourceFile(fileName, "", languageVersion);
+  }
+  if (!fileName.startsWith(libDir)) {
+    return getSourceFile(fileName, languageVersion, onError);
+  }
+  if (!libCache.has(fileName)) {
+    libCache.set(fileName, getSourceFile(fileName, languageVersion, onError));
+  }
+  return libCache.get(fileName);
+};
+host.fileExists = ((fileExists) => (fileName) => fileName === WARMUP_FILE || fileExists(fileName))(host.fileExists);
+
+// Load the compiler and parse the default lib files before a submission arrives
+ts.createProgram([WARMUP_FILE], options, host);
+
+const file = readTarget(Number(process.argv[2]));
+const program = ts.createProgram([file], options, host);
+const emitResult = program.emit();
+const diagnostics = ts.getPreEmitDiagnostics(program).concat(emitResult.diagnostics);
+if (diagnostics.length > 0) {
+  process.stdout.write(
+    ts.formatDiagnostics(diagnostics, {
+      getCanonicalFileName: (fileName) => fileName,
+      getCurrentDirectory: () => process.cwd(),
+      getNewLine: () => ts.sys.newLine,
+    }),
+  );
+}
+if (emitResult.emitSkipped) {
+  process.exit(1);
+}
+process.exit(diagnostics.some((d) => d.category === ts.DiagnosticCategory.Error) ? 2 : 0);
@@ -0,0 +1,84 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+import logging
+
+cache_dir = os.environ.get("COMPILE_CACHE_DIR", "cache")
+cache_max_bytes = int(os.environ.get("COMPILE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+
+class CompileCache:
+    """
+    Content-addressed store of compiled artifacts on local disk. Entries are directories named after
+    the hash of (language, compile command, source). An entry's mtime is bumped on every hit, and the
+    least recently used entries are evicted once the cache grows past `max_bytes`.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def key(self, lang: str, command: list[str], code: str) -> str:
+        digest = hashlib.sha256()
+        for part in [lang, *command, code]:
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def restore(self, key: str, dest: str) -> bool:
+        """Copies the artifacts stored under `key` into `dest`. Returns False on a miss."""
+        entry = os.path.join(self.directory, key)
+        try:
+            shutil.copytree(entry, dest, dirs_exist_ok=True)
+            os.utime(entry)
+        except FileNotFoundError:
+            # Not cached, or evicted while we were copying
+            return False
+        return True
+
+    def store(self, key: str, src: str, artifacts: list[str]) -> None:
+        entry = os.path.join(self.directory, key)
+        if os.path.isdir(entry) or not artifacts:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=self.directory, prefix=".staging-")
+        try:
+            for artifact in artifacts:
+                shutil.copy2(os.path.join(src, artifact), staging)
+            # Publish atomically so that concurrent readers never see a half-written entry
+            os.rename(staging, entry)
+        except OSError as e:
+            # Losing the race against another task storing the same entry is fine
+            if not os.path.isdir(entry):
+                logging.warning(f"Failed to cache compile artifacts {key}: {e}")
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+        self._evict()
+
+    def _evict(self) -> None:
+        with self._lock:
+            entries = []
+            total = 0
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if name.startswith(".") or not os.path.isdir(path):
+                    continue
+                try:
+                    size = sum(f.stat().st_size for f in os.scandir(path))
+                    entries.append((os.stat(path).st_mtime, size, path))
+                except FileNotFoundError:
+                    continue
+                total += size
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                logging.info(f"Evicting compile cache entry {os.path.basename(path)}")
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+
+cache = CompileCache(cache_dir, cache_max_bytes)
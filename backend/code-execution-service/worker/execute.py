@@ -1,142 +1,195 @@
 import subprocess
 from subprocess import CompletedProcess
 import os
+import glob
+import time
+import shutil
+import tempfile
+import signal
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from runtime_pool import pool
+from compile_cache import cache
+from process_output import OutputCallback, compile_output_limit
+import limits
 
 compile_shell = os.environ.get("COMPILE_SHELL") == "True"
+batch_parallelism = int(os.environ.get("BATCH_PARALLELISM", os.cpu_count() or 1))
 
-def execute(code: str, lang: str, input: str, timeout: int) -> tuple[str | None, str | None]:
-    match lang:
-        case "python":
-            result = _execute_python(code, input, timeout)
-        case "javascript":
-            result = _execute_javascript(code, input, timeout)
-        case "typescript":
-            result =  _execute_typescript(code, input, timeout)
-        case "java":
-            result =  _execute_java(code, input, timeout)
-        case "c":
-            result =  _execute_c(code, input, timeout)
-        case "cpp":
-            result =  _execute_cpp(code, input, timeout)
-    _cleanup()
-    return result
+# Source file each language is written to
+_SOURCES = {
+    "python": "solution.py",
+    "javascript": "solution.js",
+    "typescript": "solution.ts",
+    "java": "Solution.java",
+    "c": "solution.c",
+    "cpp": "solution.cpp",
+}
+
+# Compiler runtime, command and glob of the artifacts it produces
+_COMPILERS = {
+    "typescript": ("tsc", ["tsc", "solution.ts"], "solution.js"),
+    "java": ("javac", ["javac", "Solution.java"], "*.class"),
+    "c": ("gcc", ["gcc", "solution.c", "-o", "solution"], "solution"),
+    "cpp": ("g++", ["g++", "solution.cpp", "-o", "solution"], "solution"),
+}
+
+# Runtime, warm target and cold command (confined by limits.command) that run the (compiled) program
+_RUNNERS = {
+    "python": ("python", "solution.py", limits.command(["python", "solution.py"])),
+    "javascript": ("node", "solution.js", limits.command(["node", *limits.heap_flags("node"), "solution.js"],
+                                                         address_space=False)),
+    "typescript": ("node", "solution.js", limits.command(["node", *limits.heap_flags("node"), "solution.js"],
+                                                         address_space=False)),
+    "java": ("java", ".", limits.command(["java", *limits.heap_flags("java"), "-cp", ".", "Solution"],
+                                         address_space=False)),
+    "c": ("native", "solution", limits.command([os.path.join(".", "solution")])),
+    "cpp": ("native", "solution", limits.command([os.path.join(".", "solution")])),
+}
+
+def execute(code: str, lang: str, input: str, timeout: int,
+            on_output: OutputCallback | None = None) -> tuple[str | None, str | None, dict]:
+    # Every task gets its own directory so that several tasks can run side by side
+    workdir = tempfile.mkdtemp(dir="temp", prefix="task-")
+    try:
+        compile_error, details = _build(code, lang, workdir)
+        if compile_error is not None:
+            return None, compile_error, details
+        output, error, _, truncated, usage = _run(lang, input, timeout, workdir, on_output)
+        details["truncated"] = truncated
+        details["usage"] = usage
+        return output, error, details
+    finally:
+        _cleanup(workdir)
+
+def execute_batch(code: str, lang: str, inputs: list[str], expected_outputs: list[str | None] | None,
+                  timeout: int, stop_on_failure: bool = False) -> tuple[str | None, dict]:
+    """
+    Compiles once and runs every input against the result, `batch_parallelism` cases at a time.
+    Returns the compile error (if any) and details including the per-case results.
+    """
+    if expected_outputs is None:
+        expected_outputs = [None] * len(inputs)
+    workdir = tempfile.mkdtemp(dir="temp", prefix="task-")
+    try:
+        compile_error, details = _build(code, lang, workdir)
+        if compile_error is not None:
+            return compile_error, details
+
+        workers = max(1, min(batch_parallelism, len(inputs)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_run_case, lang, input, expected, timeout, workdir, workers > 1)
+                       for input, expected in zip(inputs, expected_outputs)]
+            cases = []
+            for future in futures:
+                if future.cancelled():
+                    cases.append({"output": None, "error": None, "verdict": "skipped", "time_ms": None,
+                                  "truncated": False, "usage": None})
+                    continue
+                case = future.result()
+                cases.append(case)
+                if stop_on_failure and case["verdict"] not in ("accepted", "completed"):
+                    for pending in futures:
+                        pending.cancel()
+        details["cases"] = cases
+        return None, details
+    finally:
+        _cleanup(workdir)
 
 def _handle_compile_error(result: CompletedProcess[bytes]) -> tuple[str | None, str | None]:
     if result.stderr:
-        return None, result.stderr.decode()
+        return None, result.stderr.decode(errors="replace")
     else:
-        return None, result.stdout.decode()
+        return None, result.stdout.decode(errors="replace")
 
-def _execute_python(code: str, input: str, timeout: int) -> tuple[str | None, str | None]:
-    with open("temp/solution.py", "w") as f:
+def _write_source(workdir: str, filename: str, code: str) -> None:
+    with open(os.path.join(workdir, filename), "w") as f:
         f.write(code)
-    
-    try:
-        result = subprocess.run(["python", "temp/solution.py"],
-                                input=input.encode(),
-                                capture_output=True,
-                                timeout=timeout,
-                                )
-        return result.stdout.decode(), result.stderr.decode()
-    except subprocess.TimeoutExpired:
-        return None, "Timeout"
 
-def _execute_javascript(code: str, input: str, timeout: int) -> tuple[str | None, str | None]:
-    with open("temp/solution.js", "w") as f:
-        f.write(code)
-    
-    try:
-        result = subprocess.run(["node", "temp/solution.js"],
-                                input=input.encode(),
-                                capture_output=True,
-                                timeout=timeout,
-                                )
-        return result.stdout.decode(), result.stderr.decode()
-    except subprocess.TimeoutExpired:
-        return None, "Timeout"
+def _build(code: str, lang: str, workdir: str) -> tuple[str | None, dict]:
+    """Writes the source into `workdir` and compiles it if needed. Returns the compile error, if any."""
+    _write_source(workdir, _SOURCES[lang], code)
+    if lang not in _COMPILERS:
+        return None, {}
+    result, cache_hit = _compile(lang, code, workdir)
+    if result is not None and result.returncode != 0:
+        return _handle_compile_error(result)[1], {"compile_cache_hit": cache_hit}
+    return None, {"compile_cache_hit": cache_hit}
 
-def _execute_typescript(code: str, input: str, timeout: int) -> tuple[str | None, str | None]:
-    with open("temp/solution.ts", "w") as f:
-        f.write(code)
-    
-    try:
-        result = subprocess.run(["tsc", "temp/solution.ts"],
-                                capture_output=True,
-                                shell=compile_shell,
-                                )
-        if result.returncode != 0:
-            return _handle_compile_error(result)
-        result = subprocess.run(["node", "temp/solution.js"],
-                                input=input.encode(),
-                                capture_output=True,
-                                timeout=timeout,
-                                )
-        return result.stdout.decode(), result.stderr.decode()
-    except subprocess.TimeoutExpired:
-        return None, "Timeout"
+def _compile(lang: str, code: str, workdir: str) -> tuple[CompletedProcess[bytes] | None, bool]:
+    """
+    Compiles in `workdir` unless the artifacts are cached for this source.
+    Returns the compiler's result (None on a cache hit) and whether the cache was hit.
+    """
+    runtime, command, artifacts = _COMPILERS[lang]
+    key = cache.key(lang, command, code)
+    if cache.restore(key, workdir):
+        logging.info(f"Compile cache hit for {lang} {key}")
+        return None, True
+    result = pool.run(runtime, _SOURCES[lang], command,
+                      shell=compile_shell,
+                      cwd=workdir,
+                      output_limit=compile_output_limit,
+                      )
+    if result.returncode == 0:
+        cache.store(key, workdir, [os.path.basename(path) for path in glob.glob(os.path.join(workdir, artifacts))])
+    return result, False
 
-def _execute_java(code: str, input: str, timeout: int) -> tuple[str | None, str | None]:
-    with open("temp/Solution.java", "w") as f:
-        f.write(code)
-    
+def _run(lang: str, input: str, timeout: int, workdir: str, on_output: OutputCallback | None = None
+         ) -> tuple[str | None, str | None, int | None, bool, dict | None]:
+    runtime, target, command = _RUNNERS[lang]
     try:
-        result = subprocess.run(["javac", "temp/Solution.java"],
-                                capture_output=True,
-                                shell=compile_shell,
-                                )
-        if result.returncode != 0:
-            return _handle_compile_error(result)
-        result = subprocess.run(["java", "-cp", "temp", "Solution"],
-                                input=input.encode(),
-                                capture_output=True,
-                                timeout=timeout,
-                                )
-        return result.stdout.decode(), result.stderr.decode()
+        result = pool.run(runtime, target, command,
+                          input=input.encode(),
+                          timeout=timeout,
+                          cwd=workdir,
+                          on_output=on_output,
+                          )
     except subprocess.TimeoutExpired:
-        return None, "Timeout"
+        return None, "Timeout", None, False, None
+    if result.returncode in (-signal.SIGXCPU, -signal.SIGKILL) and not result.truncated \
+            and result.usage["cpu_ms"] >= limits.cpu_limit_seconds * 1000:
+        return None, "CPU time limit exceeded", None, False, result.usage
+    return (result.stdout.decode(errors="replace"), result.stderr.decode(errors="replace"),
+            result.returncode, result.truncated, result.usage)
 
-def _execute_c(code: str, input: str, timeout: int) -> tuple[str | None, str | None]:
-    with open("temp/solution.c", "w") as f:
-        f.write(code)
-    
+def _run_case(lang: str, input: str, expected: str | None, timeout: int, workdir: str, isolate: bool) -> dict:
+    """
+    Runs one case of a batch. With `isolate`, it runs in a copy of `workdir`, so that cases running
+    in parallel do not see the files the others write.
+    """
+    case_dir = workdir
+    if isolate:
+        case_dir = tempfile.mkdtemp(dir="temp", prefix="case-")
+        shutil.copytree(workdir, case_dir, dirs_exist_ok=True)
     try:
-        result = subprocess.run(["gcc", "temp/solution.c", "-o", "temp/solution"],
-                                capture_output=True,
-                                shell=compile_shell,
-                                )
-        if result.returncode != 0:
-            return _handle_compile_error(result)
-        result = subprocess.run(["temp/solution"],
-                                input=input.encode(),
-                                capture_output=True,
-                                timeout=timeout,
-                                )
-        return result.stdout.decode(), result.stderr.decode()
-    except subprocess.TimeoutExpired:
-        return None, "Timeout"
+        start = time.perf_counter()
+        output, error, returncode, truncated, usage = _run(lang, input, timeout, case_dir)
+        time_ms = round((time.perf_counter() - start) * 1000, 2)
+    finally:
+        if isolate:
+            _cleanup(case_dir)
+    if returncode is None:
+        verdict = "time_limit_exceeded"
+    elif truncated:
+        verdict = "output_limit_exceeded"
+    elif returncode != 0:
+        verdict = "runtime_error"
+    elif expected is None:
+        verdict = "completed"
+    elif _compare_output(output, expected):
+        verdict = "accepted"
+    else:
+        verdict = "wrong_answer"
+    return {"output": output, "error": error, "verdict": verdict, "time_ms": time_ms, "truncated": truncated,
+            "usage": usage}
 
-def _execute_cpp(code: str, input: str, timeout: int) -> tuple[str | None, str | None]:
-    with open("temp/solution.cpp", "w") as f:
-        f.write(code)
-    
-    try:
-        result = subprocess.run(["g++", "temp/solution.cpp", "-o", "temp/solution"],
-                                capture_output=True,
-                                shell=compile_shell,
-                                )
-        if result.returncode != 0:
-            return _handle_compile_error(result)
-        result = subprocess.run(["temp/solution"],
-                                input=input.encode(),
-                                capture_output=True,
-                                timeout=timeout,
-                                )
-        return result.stdout.decode(), result.stderr.decode()
-    except subprocess.TimeoutExpired:
-        return None, "Timeout"
+def _compare_output(actual: str, expected: str) -> bool:
+    # Same rules as the question service: ignore surrounding whitespace on the output and on each line
+    actual_lines = [line.strip() for line in actual.strip().split("\n")]
+    expected_lines = [line.strip() for line in expected.strip().split("\n")]
+    return actual_lines == expected_lines
 
-def _cleanup():
-    for file in os.listdir("temp"):
-        logging.info(f"Removing {file}")
-        os.remove(f"temp/{file}")
+def _cleanup(workdir: str):
+    logging.info(f"Removing {workdir}")
+    shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,57 @@
+import os
+import resource
+
+memory_limit_mb = int(os.environ.get("LIMIT_MEMORY_MB", 256))
+cpu_limit_seconds = int(os.environ.get("LIMIT_CPU_SECONDS", 10))
+# RLIMIT_NPROC counts every process of the user, not just the submission's, so it is off by default
+process_limit = int(os.environ.get("LIMIT_PROCESSES", 0))
+file_size_limit_bytes = int(os.environ.get("LIMIT_FILE_SIZE_BYTES", 1024 * 1024))
+
+
+def command(args: list[str], address_space: bool = True) -> list[str]:
+    """
+    Returns `args` run under `prlimit`, confining the program with rlimits. Set 0 to disable a limit.
+    The limits are set by the wrapper rather than by a `preexec_fn`, which is not safe to use while
+    other threads are running, as they are when the cases of a batch run in parallel.
+
+    Node and the JVM reserve far more address space than they use, so they cannot run under
+    RLIMIT_AS; their memory is capped with `heap_flags` instead.
+    """
+    flags = []
+    if address_space and memory_limit_mb:
+        memory = memory_limit_mb * 1024 * 1024
+        flags.append(f"--as={memory}:{memory}")
+    if cpu_limit_seconds:
+        # SIGXCPU at the soft limit, SIGKILL one second later if it is ignored
+        flags.append(f"--cpu={cpu_limit_seconds}:{cpu_limit_seconds + 1}")
+    if process_limit:
+        flags.append(f"--nproc={process_limit}:{process_limit}")
+    if file_size_limit_bytes:
+        flags.append(f"--fsize={file_size_limit_bytes}:{file_size_limit_bytes}")
+    if not flags:
+        return args
+    return ["prlimit", *flags, "--", *args]
+
+
+def heap_flags(runtime: str) -> list[str]:
+    if not memory_limit_mb:
+        return []
+    match runtime:
+        case "node":
+            return [f"--max-old-space-size={memory_limit_mb}"]
+        case "java":
+            return [f"-Xmx{memory_limit_mb}m"]
+    return []
+
+
+def usage(rusage: resource.struct_rusage, wall_seconds: float, peak_rss_kb: int | None = None) -> dict:
+    """
+    `peak_rss_kb` is the peak RSS measured after exec (see peak_rss.py). Without it, ru_maxrss is used,
+    which includes what the process inherited from the worker it was forked from.
+    """
+    return {
+        "wall_ms": round(wall_seconds * 1000, 2),
+        "cpu_ms": round((rusage.ru_utime + rusage.ru_stime) * 1000, 2),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_kb": rusage.ru_maxrss if peak_rss_kb is None else peak_rss_kb,
+    }
@@ -0,0 +1,74 @@
+import os
+import shutil
+import atexit
+import logging
+import tempfile
+import threading
+import subprocess
+
+SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bootstrap", "peak_rss.c")
+
+_lock = threading.Lock()
+_built = False
+_wrapper: str | None = None
+
+
+def wrapper() -> str | None:
+    """
+    The `peak_rss` wrapper (see bootstrap/peak_rss.c), compiled on first use, or None if it cannot be
+    built. Without it, the peak RSS of a run includes the worker's own.
+    """
+    global _built, _wrapper
+    with _lock:
+        if not _built:
+            _wrapper = _build()
+            _built = True
+        return _wrapper
+
+
+def spawn(args: list[str], **kwargs) -> tuple[subprocess.Popen, int | None]:
+    """
+    `subprocess.Popen(args, **kwargs)` under the wrapper. Returns the process and the file descriptor
+    the peak RSS of the command will be reported on (see `read`), or None if it is not wrapped.
+    """
+    binary = wrapper()
+    if binary is None or kwargs.get("shell"):
+        return subprocess.Popen(args, **kwargs), None
+    read_fd, write_fd = os.pipe()
+    try:
+        proc = subprocess.Popen([binary, str(write_fd), *args],
+                                pass_fds=(*kwargs.pop("pass_fds", ()), write_fd),
+                                **kwargs)
+    except BaseException:
+        os.close(read_fd)
+        raise
+    finally:
+        os.close(write_fd)
+    return proc, read_fd
+
+
+def read(fd: int) -> int | None:
+    """The peak RSS in kilobytes reported on `fd` once the process has exited, None if it was not."""
+    try:
+        data = os.read(fd, 64)
+    finally:
+        os.close(fd)
+    try:
+        return int(data)
+    except ValueError:
+        return None
+
+
+def _build() -> str | None:
+    if os.name != "posix" or not shutil.which("gcc"):
+        logging.warning("gcc is unavailable, the peak RSS of runs will include the worker's")
+        return None
+    directory = tempfile.mkdtemp(prefix="peak-rss-")
+    atexit.register(shutil.rmtree, directory, ignore_errors=True)
+    binary = os.path.join(directory, "peak_rss")
+    result = subprocess.run(["gcc", "-O2", "-o", binary, SOURCE], capture_output=True)
+    if result.returncode != 0:
+        logging.error(f"Failed to compile peak_rss.c, the peak RSS of runs will include the worker's: "
+                      f"{result.stderr.decode(errors='replace')}")
+        return None
+    return binary
@@ -0,0 +1,148 @@
+import subprocess
+from subprocess import CompletedProcess
+import os
+import time
+import resource
+import signal
+import selectors
+import threading
+from typing import Callable
+from limits import usage
+import peak_rss
+
+output_limit = int(os.environ.get("OUTPUT_LIMIT_BYTES", 64 * 1024))
+# Compilers print a long error for every mistake, so their output is only capped against runaways
+compile_output_limit = int(os.environ.get("COMPILE_OUTPUT_LIMIT_BYTES", 1024 * 1024))
+flush_interval = float(os.environ.get("OUTPUT_FLUSH_INTERVAL", 0.2))
+
+OutputCallback = Callable[[str, bytes], None]
+
+
+class CappedProcess(CompletedProcess):
+    """
+    A CompletedProcess whose output may have been cut off at its output limit, along with the
+    wall time, CPU time and peak RSS of the process.
+    """
+
+    def __init__(self, args, returncode: int, stdout: bytes, stderr: bytes, truncated: bool, usage: dict):
+        super().__init__(args, returncode, stdout, stderr)
+        self.truncated = truncated
+        self.usage = usage
+
+
+def communicate(proc: subprocess.Popen, input: bytes | None, timeout: int | None,
+                on_output: OutputCallback | None = None, limit: int | None = None,
+                peak_rss_fd: int | None = None) -> CappedProcess:
+    """
+    Feeds `input` to `proc` and reads its stdout and stderr as they are produced, keeping at most
+    `limit` bytes in total (`output_limit` by default). The process is killed as soon as it goes past the limit, so a
+    program printing in a loop cannot exhaust memory before the timeout. If `on_output` is given,
+    new output is passed to it as ("stdout" | "stderr", bytes) every `flush_interval` seconds.
+    `peak_rss_fd` is where the `peak_rss` wrapper `proc` runs under reports its command's peak RSS.
+
+    Raises `TimeoutExpired` like `subprocess.run` if the process runs for longer than `timeout`.
+    """
+    if limit is None:
+        limit = output_limit
+    start = time.monotonic()
+    writer = threading.Thread(target=_write_input, args=(proc.stdin, input), daemon=True)
+    writer.start()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    output = {"stdout": bytearray(), "stderr": bytearray()}
+    pending = {"stdout": bytearray(), "stderr": bytearray()}
+    total = 0
+    truncated = False
+    last_flush = time.monotonic()
+
+    try:
+        with selectors.DefaultSelector() as selector:
+            selector.register(proc.stdout, selectors.EVENT_READ, "stdout")
+            selector.register(proc.stderr, selectors.EVENT_READ, "stderr")
+            while selector.get_map() and not truncated:
+                wait = flush_interval
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise subprocess.TimeoutExpired(proc.args, timeout)
+                    wait = min(wait, remaining)
+                for key, _ in selector.select(wait):
+                    chunk = os.read(key.fd, 65536)
+                    if not chunk:
+                        selector.unregister(key.fileobj)
+                        continue
+                    allowed = limit - total
+                    if len(chunk) > allowed:
+                        chunk = chunk[:allowed]
+                        truncated = True
+                    total += len(chunk)
+                    output[key.data] += chunk
+                    pending[key.data] += chunk
+                if on_output is not None and time.monotonic() - last_flush >= flush_interval:
+                    _flush(pending, on_output)
+                    last_flush = time.monotonic()
+
+        if truncated:
+            _kill(proc, peak_rss_fd is not None)
+        rusage = _reap(proc, deadline)
+    except subprocess.TimeoutExpired:
+        _kill(proc, peak_rss_fd is not None)
+        _reap(proc, None)
+        raise
+    finally:
+        if on_output is not None:
+            _flush(pending, on_output)
+        proc.stdout.close()
+        proc.stderr.close()
+        writer.join()
+        peak_rss_kb = None
+        if peak_rss_fd is not None:
+            # Written by the wrapper just before it exits, so it is only there once it has been reaped
+            if proc.returncode is not None:
+                peak_rss_kb = peak_rss.read(peak_rss_fd)
+            else:
+                os.close(peak_rss_fd)
+    return CappedProcess(proc.args, proc.returncode, bytes(output["stdout"]), bytes(output["stderr"]), truncated,
+                         usage(rusage, time.monotonic() - start, peak_rss_kb))
+
+
+def _kill(proc: subprocess.Popen, wrapped: bool) -> None:
+    """
+    Kills `proc` without reaping it. `Popen.kill` polls first, so a process that has just exited would
+    be reaped there and its resource usage lost. Until it is waited for, its PID cannot be reused.
+    A `peak_rss` wrapper is asked to kill its command instead, so that it still reports on it.
+    """
+    if proc.returncode is None:
+        os.kill(proc.pid, signal.SIGTERM if wrapped else signal.SIGKILL)
+
+
+def _reap(proc: subprocess.Popen, deadline: float | None) -> resource.struct_rusage | None:
+    """Waits for `proc` like `Popen.wait`, but with wait4 so that its resource usage is available."""
+    if proc.returncode is not None:
+        return None
+    delay = 0.0005
+    while True:
+        pid, status, rusage = os.wait4(proc.pid, 0 if deadline is None else os.WNOHANG)
+        if pid:
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            return rusage
+        if time.monotonic() >= deadline:
+            raise subprocess.TimeoutExpired(proc.args, None)
+        time.sleep(delay)
+        delay = min(delay * 2, 0.02)
+
+
+def _write_input(stdin, input: bytes | None) -> None:
+    try:
+        if input:
+            stdin.write(input)
+        stdin.close()
+    except (BrokenPipeError, ValueError):
+        # The program exited (or was killed) without reading all of its input
+        pass
+
+
+def _flush(pending: dict[str, bytearray], on_output: OutputCallback) -> None:
+    for stream, data in pending.items():
+        if data:
+            on_output(stream, bytes(data))
+            data.clear()
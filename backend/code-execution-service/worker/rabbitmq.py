@@ -2,30 +2,91 @@ import pika
 import os
 import json
 import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
 
-from execute import execute
-from redis_model import start_task, finish_task
+from execute import execute, execute_batch
+from redis_model import start_task, finish_task, append_output
+from runtime_pool import pool
+from task_updates import TaskUpdates
+import peak_rss
+
+concurrency = int(os.environ.get("WORKER_CONCURRENCY", 1))
+executor = ThreadPoolExecutor(max_workers=concurrency) if concurrency > 1 else None
+# The executor's threads write their updates to Redis together
+updates = TaskUpdates() if executor is not None else None
+start = start_task if updates is None else updates.start
+finish = finish_task if updates is None else updates.finish
+
+def run_task(data: dict) -> None:
+    logging.info(f"{data=}")
+    if not start(data["id"]):
+        # Expired or deleted while queued, nobody is waiting for it
+        logging.warning(f"Task {data['id']} no longer exists, skipping it")
+        return
+    if data.get("inputs") is not None:
+        output = None
+        error, details = execute_batch(data["code"], data["lang"], data["inputs"], data.get("expected_outputs"),
+                                       int(data["timeout"]), data.get("stop_on_failure", False))
+    else:
+        output, error, details = execute(data["code"], data["lang"], data["input"], int(data["timeout"]),
+                                         functools.partial(append_output, data["id"]))
+    finish(data["id"], output, error, details)
+    logging.info(f"{output=}, {error=}, {details=}")
+    logging.info(f"Runtime latency: {pool.latency_report()}")
+
+def _run_safely(data: dict) -> bool:
+    """
+    Runs the task, or stores that it failed so that its waiters are answered. Returns False if not even
+    the failure could be stored, in which case the message is requeued.
+    """
+    try:
+        run_task(data)
+        return True
+    except Exception as e:
+        logging.exception(f"Task {data.get('id')} failed: {e}")
+    if data.get("id") is None:
+        return True
+    try:
+        finish(data["id"], None, "Internal error while executing the code", {})
+        return True
+    except Exception as e:
+        logging.exception(f"Failed to store the failure of task {data['id']}: {e}")
+        return False
+
+def _settle(ch, delivery_tag, succeeded: bool) -> None:
+    if succeeded:
+        ch.basic_ack(delivery_tag=delivery_tag)
+    else:
+        ch.basic_nack(delivery_tag=delivery_tag, requeue=True)
+
+def _run_and_ack(connection, ch, delivery_tag, data: dict) -> None:
+    succeeded = _run_safely(data)
+    # pika channels are not thread-safe, the ack has to be sent from the connection's thread
+    connection.add_callback_threadsafe(functools.partial(_settle, ch, delivery_tag, succeeded))
 
 def callback(ch, method, properties, body):
     data = json.loads(body)
-    logging.info(f"{data=}")
-    start_task(data["id"])
-    output, error = execute(data["code"], data["lang"], data["input"], int(data["timeout"]))
-    finish_task(data["id"], output, error)
-    logging.info(f"{output=}, {error=}")
-    ch.basic_ack(delivery_tag=method.delivery_tag)
+    if executor is None:
+        _settle(ch, method.delivery_tag, _run_safely(data))
+    else:
+        executor.submit(_run_and_ack, ch.connection, ch, method.delivery_tag, data)
 
 def main():
-    logging.info("Starting worker")
+    logging.info(f"Starting worker with concurrency {concurrency}")
+    # Built before the first task rather than during it
+    peak_rss.wrapper()
+    pool.start()
     connection = pika.BlockingConnection(pika.ConnectionParameters(
     host=os.environ.get('RABBITMQ_HOST'), port=os.environ.get('RABBITMQ_PORT'), heartbeat=30))
     channel = connection.channel()
     channel.queue_declare(queue='code-execution', durable=True)
-    channel.basic_qos(prefetch_count=1)
+    # RabbitMQ hands out at most one unacknowledged task per executor thread
+    channel.basic_qos(prefetch_count=concurrency)
     channel.basic_consume(queue='code-execution',
                           on_message_callback=callback)
     logging.info('Ready to receive messages')
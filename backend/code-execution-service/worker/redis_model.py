@@ -7,14 +7,71 @@ pool = redis.ConnectionPool(host=os.environ.get("REDIS_HOST"),
                             db=0)
 r = redis.Redis(connection_pool=pool)
 
-def start_task(task_id: str) -> None:
-    task = json.loads(r.get(task_id))
-    task["started"] = True
-    r.set(task_id, json.dumps(task))
-
-def finish_task(task_id: str, output: str, error: str) -> None:
-    task = json.loads(r.get(task_id))
-    task["finished"] = True
-    task["output"] = output
-    task["error"] = error
-    r.set(task_id, json.dumps(task))
+# How long a task's result is kept once it has finished
+task_result_ttl = int(os.environ.get("TASK_RESULT_TTL", 60 * 60))
+# How long partial output is kept if a task never finishes (e.g. the worker crashed)
+task_ttl = int(os.environ.get("TASK_TTL", 24 * 60 * 60))
+
+# The execution API waits on this channel for tasks to finish instead of polling
+TASK_FINISHED_CHANNEL = "code-execution:finished"
+
+# Tasks are hashes with one JSON-encoded value per field, so that each field can be written on its own.
+# A task is only updated while it exists, so that a write after it expired does not bring it back
+# without a TTL. Tasks registered as a JSON string, before they were hashes, are converted first.
+_update_task = r.register_script("""
+local kind = redis.call("TYPE", KEYS[1])["ok"]
+if kind == "none" then
+    return 0
+end
+if kind == "string" then
+    local task = cjson.decode(redis.call("GET", KEYS[1]))
+    redis.call("DEL", KEYS[1])
+    for field, value in pairs(task) do
+        redis.call("HSET", KEYS[1], field, cjson.encode(value))
+    end
+end
+redis.call("HSET", KEYS[1], unpack(ARGV, 2))
+redis.call("EXPIRE", KEYS[1], ARGV[1])
+return 1
+""")
+
+def start_task(task_id: str) -> bool:
+    return start_tasks([task_id])[0]
+
+def start_tasks(task_ids: list[str]) -> list[bool]:
+    """Marks many tasks as started in one round trip. Returns whether each still existed."""
+    with r.pipeline() as pipe:
+        for task_id in task_ids:
+            _update_task(keys=[task_id], args=[task_ttl, "started", json.dumps(True)], client=pipe)
+        return [bool(updated) for updated in pipe.execute()]
+
+def finish_task(task_id: str, output: str, error: str, details: dict) -> bool:
+    return finish_tasks([(task_id, output, error, details)])[0]
+
+def finish_tasks(results: list[tuple[str, str, str, dict]]) -> list[bool]:
+    """
+    Stores the results of many tasks in one round trip, and notifies whoever is waiting on them.
+    Returns whether each task still existed; those that did not are left deleted.
+    """
+    with r.pipeline() as pipe:
+        for task_id, output, error, details in results:
+            fields = {"finished": True, "output": output, "error": error, **details}
+            _update_task(keys=[task_id], args=[task_result_ttl, *_flatten(fields)], client=pipe)
+            # The full output is in the task now, the partial output is no longer needed
+            pipe.delete(output_stream_key(task_id))
+            pipe.publish(TASK_FINISHED_CHANNEL, task_id)
+        replies = pipe.execute()
+    # Three replies per task, the first from the script
+    return [bool(updated) for updated in replies[::3]]
+
+def _flatten(fields: dict) -> list[str]:
+    return [item for field, value in fields.items() for item in (field, json.dumps(value))]
+
+def output_stream_key(task_id: str) -> str:
+    return f"{task_id}:output"
+
+def append_output(task_id: str, stream: str, data: bytes) -> None:
+    with r.pipeline() as pipe:
+        pipe.xadd(output_stream_key(task_id), {"stream": stream, "data": data})
+        pipe.expire(output_stream_key(task_id), task_ttl)
+        pipe.execute()
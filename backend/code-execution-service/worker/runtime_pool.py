@@ -0,0 +1,188 @@
+import subprocess
+import os
+import shutil
+import tempfile
+import threading
+import time
+import atexit
+import logging
+from collections import deque
+from process_output import CappedProcess, OutputCallback, communicate
+import limits
+import peak_rss
+
+pool_size = int(os.environ.get("RUNTIME_POOL_SIZE", 0))
+pool_runtimes = os.environ.get("RUNTIME_POOL_RUNTIMES", "python,node,tsc,java").split(",")
+
+BOOTSTRAP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bootstrap")
+
+
+class RuntimePool:
+    """
+    Keeps `size` pre-spawned processes per runtime. Each one has already paid the interpreter / JVM /
+    compiler start-up cost and is blocked reading the working directory and the program to run from a
+    control pipe. A process serves exactly one submission, so every run still gets a fresh, isolated
+    process.
+    """
+
+    def __init__(self, size: int, runtimes: list[str]):
+        self.size = size
+        self.runtimes = runtimes
+        self._commands: dict[str, tuple[list[str], dict | None]] = {}
+        # Process, control pipe and the pipe its peak RSS is reported on, see peak_rss.spawn
+        self._idle: dict[str, deque[tuple[subprocess.Popen, int, int | None]]] = {}
+        self._latency: dict[str, dict[str, list]] = {}
+        self._lock = threading.Lock()
+        self._java_classes = None
+
+    def start(self) -> None:
+        if self.size <= 0 or os.name != "posix":
+            return
+        for runtime in self.runtimes:
+            command = self._build_command(runtime)
+            if command is None:
+                logging.warning(f"Runtime pool: {runtime} is unavailable, it will always start cold")
+                continue
+            self._commands[runtime] = command
+            self._idle[runtime] = deque()
+            for _ in range(self.size):
+                self._spawn(runtime)
+        logging.info(f"Runtime pool started with {self.size} process(es) for {list(self._commands)}")
+
+    def close(self) -> None:
+        with self._lock:
+            idle = [entry for entries in self._idle.values() for entry in entries]
+            self._idle = {runtime: deque() for runtime in self._idle}
+        for proc, control, peak_rss_fd in idle:
+            os.close(control)
+            if peak_rss_fd is not None:
+                os.close(peak_rss_fd)
+            proc.kill()
+            proc.wait()
+        if self._java_classes:
+            shutil.rmtree(self._java_classes, ignore_errors=True)
+
+    def run(self, runtime: str, target: str, cold_args: list[str], input: bytes | None = None,
+            timeout: int | None = None, shell: bool = False, cwd: str = ".",
+            on_output: OutputCallback | None = None, output_limit: int | None = None) -> CappedProcess:
+        """
+        Runs `target` (relative to `cwd`) on a warm `runtime` process when one is idle, otherwise falls
+        back to `cold_args`. Behaves like `subprocess.run(..., capture_output=True)`, including raising
+        `TimeoutExpired`, except that output is capped at `output_limit` and can be streamed (see `communicate`).
+        `cold_args` carry their own limits (see `limits.command`); warm processes get their runtime's at spawn.
+        """
+        entry = self._take(runtime)
+        start = time.perf_counter()
+        try:
+            if entry is None:
+                proc, peak_rss_fd = peak_rss.spawn(cold_args,
+                                                   stdin=subprocess.PIPE,
+                                                   stdout=subprocess.PIPE,
+                                                   stderr=subprocess.PIPE,
+                                                   shell=shell,
+                                                   cwd=cwd,
+                                                   )
+            else:
+                proc, peak_rss_fd = self._start_warm(entry, cwd, target)
+            return communicate(proc, input, timeout, on_output, output_limit, peak_rss_fd)
+        finally:
+            self._record(runtime, entry is not None, time.perf_counter() - start)
+            if entry is not None:
+                self._spawn(runtime)
+
+    def latency_report(self) -> dict[str, dict[str, dict]]:
+        """Mean wall-clock latency in milliseconds of warm and cold runs, per runtime."""
+        with self._lock:
+            return {
+                runtime: {
+                    mode: {"count": count, "mean_ms": round(total / count * 1000, 2) if count else None}
+                    for mode, (count, total) in modes.items()
+                }
+                for runtime, modes in self._latency.items()
+            }
+
+    def _build_command(self, runtime: str) -> tuple[list[str], dict | None] | None:
+        # Processes that run submissions are confined by the same limits as cold starts
+        match runtime:
+            case "python":
+                return limits.command(["python", os.path.join(BOOTSTRAP_DIR, "bootstrap.py")]), None
+            case "node":
+                if not shutil.which("node"):
+                    return None
+                return (limits.command(["node", *limits.heap_flags("node"), os.path.join(BOOTSTRAP_DIR, "bootstrap.js")],
+                                       address_space=False), None)
+            case "tsc":
+                if not shutil.which("node") or not shutil.which("npm"):
+                    return None
+                result = subprocess.run(["npm", "root", "-g"], capture_output=True)
+                if result.returncode != 0:
+                    return None
+                env = dict(os.environ, NODE_PATH=result.stdout.decode().strip())
+                return ["node", os.path.join(BOOTSTRAP_DIR, "tsc_bootstrap.js")], env
+            case "java":
+                if not shutil.which("java") or not shutil.which("javac"):
+                    return None
+                self._java_classes = tempfile.mkdtemp(prefix="bootstrap-")
+                result = subprocess.run(["javac", "-d", self._java_classes,
+                                         os.path.join(BOOTSTRAP_DIR, "Bootstrap.java")],
+                                        capture_output=True)
+                if result.returncode != 0:
+                    logging.error(f"Runtime pool: failed to compile Bootstrap.java: {result.stderr.decode()}")
+                    return None
+                return (limits.command(["java", *limits.heap_flags("java"), "-cp", self._java_classes, "Bootstrap"],
+                                       address_space=False), None)
+        return None
+
+    def _spawn(self, runtime: str) -> None:
+        if runtime not in self._commands:
+            return
+        args, env = self._commands[runtime]
+        read_fd, write_fd = os.pipe()
+        try:
+            proc, peak_rss_fd = peak_rss.spawn(args + [str(read_fd)],
+                                               stdin=subprocess.PIPE,
+                                               stdout=subprocess.PIPE,
+                                               stderr=subprocess.PIPE,
+                                               pass_fds=(read_fd,),
+                                               env=env,
+                                               )
+        except OSError as e:
+            os.close(write_fd)
+            logging.error(f"Runtime pool: failed to spawn {runtime}: {e}")
+            return
+        finally:
+            os.close(read_fd)
+        with self._lock:
+            self._idle[runtime].append((proc, write_fd, peak_rss_fd))
+
+    def _take(self, runtime: str) -> tuple[subprocess.Popen, int, int | None] | None:
+        with self._lock:
+            idle = self._idle.get(runtime)
+            while idle:
+                proc, control, peak_rss_fd = idle.popleft()
+                if proc.poll() is None:
+                    return proc, control, peak_rss_fd
+                os.close(control)
+                if peak_rss_fd is not None:
+                    os.close(peak_rss_fd)
+                logging.warning(f"Runtime pool: idle {runtime} process exited with {proc.returncode}")
+        return None
+
+    def _start_warm(self, entry: tuple[subprocess.Popen, int, int | None], cwd: str, target: str
+                    ) -> tuple[subprocess.Popen, int | None]:
+        proc, control, peak_rss_fd = entry
+        try:
+            os.write(control, f"{os.path.abspath(cwd)}\n{target}\n".encode())
+        finally:
+            os.close(control)
+        return proc, peak_rss_fd
+
+    def _record(self, runtime: str, warm: bool, seconds: float) -> None:
+        with self._lock:
+            stats = self._latency.setdefault(runtime, {"warm": [0, 0.0], "cold": [0, 0.0]})
+            stats["warm" if warm else "cold"][0] += 1
+            stats["warm" if warm else "cold"][1] += seconds
+
+
+pool = RuntimePool(pool_size, pool_runtimes)
+atexit.register(pool.close)
@@ -0,0 +1,61 @@
+import logging
+import threading
+from concurrent.futures import Future
+
+from redis_model import start_tasks, finish_tasks
+
+
+class TaskUpdates:
+    """
+    Writes the start and finish updates of tasks running on several threads together. The first
+    thread with an update to write writes every update queued while it does, in one round trip for
+    the starts and one for the finishes, so the other threads only wait for it.
+
+    `start` and `finish` return whether the task still existed, like `start_task` and `finish_task`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._starts: list[tuple[str, Future]] = []
+        self._finishes: list[tuple[tuple[str, str, str, dict], Future]] = []
+        self._writing = False
+
+    def start(self, task_id: str) -> bool:
+        return self._submit(self._starts, task_id)
+
+    def finish(self, task_id: str, output: str, error: str, details: dict) -> bool:
+        return self._submit(self._finishes, (task_id, output, error, details))
+
+    def _submit(self, queue: list, update) -> bool:
+        future = Future()
+        with self._lock:
+            queue.append((update, future))
+            # Otherwise the thread writing takes it with its next batch
+            write = not self._writing
+            self._writing = True
+        while write:
+            with self._lock:
+                starts, finishes = self._starts.copy(), self._finishes.copy()
+                self._starts.clear()
+                self._finishes.clear()
+                if not starts and not finishes:
+                    self._writing = False
+                    break
+            self._write(start_tasks, starts)
+            self._write(finish_tasks, finishes)
+        return future.result()
+
+    @staticmethod
+    def _write(write, updates: list[tuple[object, Future]]) -> None:
+        if not updates:
+            return
+        if len(updates) > 1:
+            logging.debug(f"Writing {len(updates)} task updates with {write.__name__}")
+        try:
+            existed = write([update for update, _ in updates])
+        except Exception as e:
+            for _, future in updates:
+                future.set_exception(e)
+            return
+        for (_, future), updated in zip(updates, existed):
+            future.set_result(updated)
@@ -0,0 +1,40 @@
+import os
+import subprocess
+import unittest
+
+import peak_rss
+from runtime_pool import RuntimePool
+
+
+class PeakRssTest(unittest.TestCase):
+    def setUp(self):
+        if peak_rss.wrapper() is None:
+            self.skipTest("the peak_rss wrapper cannot be built here")
+        self.pool = RuntimePool(0, [])
+
+    def test_excludes_the_memory_of_the_worker(self):
+        ballast = bytearray(256 * 1024 * 1024)
+        for i in range(0, len(ballast), os.sysconf("SC_PAGE_SIZE")):
+            ballast[i] = 1
+        result = self.pool.run("native", "true", ["true"])
+        self.assertEqual(result.returncode, 0)
+        self.assertLess(result.usage["peak_rss_kb"], 64 * 1024)
+
+    def test_counts_the_memory_of_the_command(self):
+        result = self.pool.run("python", "-", ["python3", "-c", "x = b'.' * (128 * 1024 * 1024)"])
+        self.assertEqual(result.returncode, 0)
+        self.assertGreater(result.usage["peak_rss_kb"], 128 * 1024)
+
+    def test_reported_when_killed_at_the_output_limit(self):
+        result = self.pool.run("native", "sh", ["sh", "-c", "while :; do echo y; done"], output_limit=1000)
+        self.assertTrue(result.truncated)
+        self.assertEqual(result.returncode, -9)
+        self.assertLess(result.usage["peak_rss_kb"], 64 * 1024)
+
+    def test_command_killed_on_timeout(self):
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.pool.run("native", "sleep", ["sleep", "30"], timeout=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import json
+import threading
+import unittest
+
+import fakeredis
+
+import redis_model
+from redis_model import start_tasks, finish_tasks
+from task_updates import TaskUpdates
+
+
+class BulkUpdateTest(unittest.TestCase):
+    def setUp(self):
+        self.r = fakeredis.FakeRedis()
+        self.patch(redis_model, "r", self.r)
+        self.patch(redis_model, "_update_task", self.r.register_script(redis_model._update_task.script))
+        for task_id in ("a", "b", "c"):
+            self.r.hset(task_id, mapping={"started": json.dumps(False), "finished": json.dumps(False)})
+
+    def patch(self, module, name, value):
+        original = getattr(module, name)
+        setattr(module, name, value)
+        self.addCleanup(setattr, module, name, original)
+
+    def test_skips_tasks_deleted_mid_batch(self):
+        self.assertEqual(start_tasks(["a", "b", "c"]), [True, True, True])
+        self.r.delete("b")
+        results = [(task_id, "out", None, {"time_ms": 1}) for task_id in ("a", "b", "c")]
+        self.assertEqual(finish_tasks(results), [True, False, True])
+
+        self.assertFalse(self.r.exists("b"))
+        for task_id in ("a", "c"):
+            self.assertEqual(json.loads(self.r.hget(task_id, "finished")), True)
+            self.assertEqual(json.loads(self.r.hget(task_id, "output")), "out")
+            self.assertGreater(self.r.ttl(task_id), 0)
+
+    def test_converts_string_tasks(self):
+        self.r.delete("a")
+        self.r.set("a", json.dumps({"started": False, "output": ""}))
+        self.assertEqual(start_tasks(["a"]), [True])
+        self.assertEqual(json.loads(self.r.hget("a", "started")), True)
+
+    def test_threads_write_together(self):
+        self.r.delete("b")
+        updates = TaskUpdates()
+        existed = {}
+
+        def run(task_id):
+            existed[task_id] = updates.start(task_id) and updates.finish(task_id, "out", None, {})
+
+        threads = [threading.Thread(target=run, args=(task_id,)) for task_id in ("a", "b", "c")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(existed, {"a": True, "b": False, "c": True})
+        self.assertFalse(self.r.exists("b"))
+        self.assertEqual(json.loads(self.r.hget("c", "finished")), True)
+
+
+if __name__ == "__main__":
+    unittest.main()
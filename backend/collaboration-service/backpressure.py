@@ -0,0 +1,79 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+import socketio
+
+
+class OutboundLimiter:
+    """
+    Keeps clients on slow links from building up unbounded outgoing queues. Events that only carry
+    the latest state (the document, cursor positions) are not sent to clients with more than
+    `max_queued` packets waiting to be written. A client that misses a code update this way is
+    stale: it gets no further code updates, which would not apply to what it has, until its queue
+    has drained, and then the current document in one message through `resync`.
+
+    Only clients connected to this instance are looked at.
+    """
+
+    def __init__(self, sio: socketio.AsyncServer, max_queued: int, interval: float,
+                 resync: Callable[[str], Awaitable[None]]):
+        self.sio = sio
+        self.max_queued = max_queued
+        self.interval = interval
+        self._resync = resync
+        self._stale: set[str] = set()
+        self._task: asyncio.Task | None = None
+
+    def skipped(self, room: str, resync: bool) -> list[str]:
+        """
+        The members of the Socket.IO room `room` that should not get the next event. With `resync`,
+        the event is a code update, and the members that are too slow for it become stale.
+        """
+        if not self.max_queued:
+            return []
+        skipped = []
+        for sid, eio_sid in self.sio.manager.get_participants('/', room):
+            if resync and sid in self._stale:
+                skipped.append(sid)
+            elif self._backlog(eio_sid) > self.max_queued:
+                skipped.append(sid)
+                if resync:
+                    logging.info(f"Client {sid} is too slow, holding back code updates until it catches up")
+                    self._stale.add(sid)
+        return skipped
+
+    def discard(self, sid: str) -> None:
+        self._stale.discard(sid)
+
+    def start(self) -> None:
+        if self._task is None and self.max_queued:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def _backlog(self, eio_sid: str) -> int:
+        socket = self.sio.eio.sockets.get(eio_sid)
+        return socket.queue.qsize() if socket is not None else 0
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            for sid in list(self._stale):
+                eio_sid = self.sio.manager.eio_sid_from_sid(sid, '/')
+                if eio_sid is None:
+                    self._stale.discard(sid)
+                elif self._backlog(eio_sid) <= self.max_queued // 2:
+                    self._stale.discard(sid)
+                    try:
+                        await self._resync(sid)
+                    except Exception as e:
+                        logging.error(f"Failed to resynchronise client {sid}: {e}")
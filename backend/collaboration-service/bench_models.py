@@ -0,0 +1,91 @@
+"""
+Memory and throughput of the in-memory room model, to size collaboration nodes.
+
+Usage: python bench_models.py [rooms] [users per room] [code bytes] [edits per room]
+
+Simulates `rooms` concurrent rooms, each with its members, a document of `code bytes` and
+`edits per room` edits in its history, then times the lookups and updates the handlers make.
+"""
+import sys
+import time
+import random
+import string
+import logging
+import tracemalloc
+
+from models import Room, User
+
+logging.basicConfig(level=logging.WARNING)
+
+
+def _timed(label: str, count: int, fn) -> None:
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {count / elapsed:>14,.0f} ops/s")
+
+
+def main():
+    rooms = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    users_per_room = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    code_bytes = int(sys.argv[3]) if len(sys.argv) > 3 else 2048
+    edits = int(sys.argv[4]) if len(sys.argv) > 4 else 20
+    code = "".join(random.choices(string.ascii_letters + "\n ", k=code_bytes))
+    sids = [[f"sid-{r}-{u}" for u in range(users_per_room)] for r in range(rooms)]
+
+    def join_all():
+        for r, room_sids in enumerate(sids):
+            for u, sid in enumerate(room_sids):
+                Room.get_or_create(f"room-{r}", User(f"user-{r}-{u}", f"user {u}", sid))
+
+    def edit_all():
+        for room in Room.rooms.values():
+            room.update_code(code)
+            for i in range(edits - 1):
+                # Typing at the end of the document
+                room.apply_operation([len(room.code), string.ascii_letters[i % 52]], room.version)
+
+    def leave_all():
+        for room_sids in sids:
+            for sid in room_sids:
+                user = User.users[sid]
+                user.room.remove_user(user)
+
+    # Memory is measured on a separate pass, as tracing allocations slows everything down
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    join_all()
+    edit_all()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    leave_all()
+    print(f"{'memory':<28} {used / 2**20:>14,.1f} MiB")
+    print(f"{'memory per room':<28} {used / rooms / 1024:>14,.1f} KiB "
+          f"({code_bytes} bytes of code, {edits} edits in history)")
+
+    _timed("join", rooms * users_per_room, join_all)
+    _timed("edit", rooms * edits, edit_all)
+
+    def lookup_all():
+        for room_sids in sids:
+            for sid in room_sids:
+                User.users[sid].room
+    _timed("lookup by sid", rooms * users_per_room, lookup_all)
+
+    def rooms_of_all():
+        for r in range(rooms):
+            User.rooms_of(f"user-{r}-0")
+    _timed("rooms of user_id", rooms, rooms_of_all)
+
+    def cursor_all():
+        for room_sids in sids:
+            for sid in room_sids:
+                User.users[sid].update_cursor_position(42)
+    _timed("cursor update", rooms * users_per_room, cursor_all)
+
+    _timed("leave", rooms * users_per_room, leave_all)
+    assert not Room.rooms and not User.users and not User.sessions
+
+
+if __name__ == "__main__":
+    main()
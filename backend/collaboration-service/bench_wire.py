@@ -0,0 +1,60 @@
+"""
+Bytes on the wire and encode CPU of collaboration payloads in each wire format.
+
+Usage: python bench_wire.py [code sizes in bytes, comma-separated]
+
+The documents are made of this service's own source code, as a stand-in for submissions. JSON is
+measured as Socket.IO sends it, the event name and payload in one JSON array.
+"""
+import sys
+import json
+import glob
+import timeit
+
+import msgpack
+
+import wire
+
+
+def _sample_code(size: int) -> str:
+    source = "".join(open(path).read() for path in sorted(glob.glob("*.py")))
+    return (source * (size // len(source) + 1))[:size]
+
+
+def _payloads(size: int) -> dict[str, object]:
+    code = _sample_code(size)
+    users = [{'username': f'user {i}', 'cursor_position': i * 37} for i in range(2)]
+    return {
+        "code_updated": code,
+        "join_request": {'user_id': '6721f0c3', 'room_details': {
+            'id': 'room', 'users': users, 'epoch': '0' * 32, 'version': 1234, 'code': code}},
+        "code_delta": {'version': 1234, 'ops': [size // 2, 'x', size - size // 2], 'sid': 'a' * 20},
+        "cursors_updated": [{'sid': 'a' * 20, 'cursor_position': 1234}, {'sid': 'b' * 20, 'cursor_position': 99}],
+    }
+
+
+def _encoders() -> dict[str, callable]:
+    return {
+        "json": lambda event, data: json.dumps([event, data], separators=(',', ':')).encode(),
+        "msgpack": lambda event, data: b'\x00' + msgpack.packb(data),
+        "msgpack+zlib": lambda event, data: wire.encode(data, wire.MSGPACK),
+    }
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1].split(",")] if len(sys.argv) > 1 else [1024, 8192, 65536]
+    print(f"compression from {wire.COMPRESS_THRESHOLD} bytes at level {wire.COMPRESS_LEVEL}")
+    print(f"{'event':<18}{'code':>8}{'format':>15}{'bytes':>10}{'ratio':>8}{'encode us':>12}")
+    for size in sizes:
+        for event, data in _payloads(size).items():
+            baseline = None
+            for name, encode in _encoders().items():
+                encoded = encode(event, data)
+                runs, seconds = timeit.Timer(lambda: encode(event, data)).autorange()
+                baseline = baseline or len(encoded)
+                print(f"{event:<18}{size:>8}{name:>15}{len(encoded):>10}{len(encoded) / baseline:>8.2f}"
+                      f"{seconds / runs * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
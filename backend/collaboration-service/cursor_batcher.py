@@ -0,0 +1,63 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+# Emits one batch of cursor positions to a room
+EmitBatch = Callable[[str, list[dict]], Awaitable[None]]
+
+
+class CursorBatcher:
+    """
+    Buffers cursor positions per room and flushes them every `interval` seconds as a single batch
+    per room, keeping only the latest position of each user. However fast clients move their
+    cursors, a tick sends at most one message per room with at most one entry per user.
+    """
+
+    def __init__(self, interval: float, emit: EmitBatch):
+        self.interval = interval
+        self._emit = emit
+        self._pending: dict[str, dict[str, int]] = {}
+        self._task: asyncio.Task | None = None
+
+    def update(self, room_id: str, sid: str, cursor_position: int) -> None:
+        self._pending.setdefault(room_id, {})[sid] = cursor_position
+
+    def discard(self, room_id: str, sid: str) -> None:
+        """Drops a buffered position, e.g. when its user leaves before the next flush."""
+        positions = self._pending.get(room_id)
+        if positions is not None:
+            positions.pop(sid, None)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        pending, self._pending = self._pending, {}
+        for room_id, positions in pending.items():
+            if not positions:
+                continue
+            batch = [{'sid': sid, 'cursor_position': position} for sid, position in positions.items()]
+            try:
+                await self._emit(room_id, batch)
+            except Exception as e:
+                logging.error(f"Failed to flush cursor positions to room {room_id}: {e}")
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # Ticks are scheduled against the clock so slow flushes do not stretch the interval
+            next_tick = loop.time() + self.interval
+            await self.flush()
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
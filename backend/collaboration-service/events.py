@@ -1,7 +1,10 @@
 class Events:
     JOIN_REQUEST = 'join_request'
     CODE_UPDATED = 'code_updated'
+    CODE_DELTA = 'code_delta'
+    CODE_RESYNC = 'code_resync'
     CURSOR_UPDATED = 'cursor_updated'
+    CURSORS_UPDATED = 'cursors_updated'
     USER_LEFT = 'user_left'
     LANGUAGE_CHANGE= 'language_change'
     CODE_SUBMITTED = 'code_submitted'
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import httpx
+
+import metrics
+
+# A leave notification: (room_id, user_id)
+Leave = tuple[str, object]
+
+
+class LeaveSessionQueue:
+    """
+    Tells the matching service that users left their sessions, in the background. Notifications
+    are queued without waiting, sent in batches over a pooled async client and retried with
+    backoff, so a slow matching service never holds up socket handling. The queue is bounded;
+    when it is full, new notifications are dropped and logged.
+    """
+
+    def __init__(self, url: str, max_size: int, batch_size: int, max_retries: int):
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self._client = httpx.AsyncClient(base_url=url, timeout=5)
+        self._queue: asyncio.Queue[Leave] = asyncio.Queue(max_size)
+        self._task: asyncio.Task | None = None
+
+    def put(self, room_id: str, user_id) -> None:
+        try:
+            self._queue.put_nowait((room_id, user_id))
+        except asyncio.QueueFull:
+            metrics.LEAVE_NOTIFICATIONS.labels('dropped').inc()
+            logging.error(f"Leave-session queue is full, dropping user {user_id} leaving room {room_id}")
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, timeout: float = 5) -> None:
+        """Sends what is still queued, for at most `timeout` seconds, then closes the client."""
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logging.error(f"Timed out sending leave-session notifications on shutdown, "
+                              f"dropping {self._queue.qsize()} still queued")
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._client.aclose()
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._send(list(dict.fromkeys(batch)))
+            except Exception as e:
+                # E.g. a response that is not JSON; the consumer has to keep going for later batches
+                logging.exception(f"Failed to send {len(batch)} leave-session notifications: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _send(self, batch: list[Leave]) -> None:
+        data = [{"roomId": room_id, "userId": user_id} for room_id, user_id in batch]
+        delay = 0.5
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self._client.put("/leave-session", json={"data": data})
+                if response.status_code < 500:
+                    break
+                error = f"status {response.status_code}: {response.content}"
+            except httpx.HTTPError as e:
+                error = repr(e)
+            if attempt == self.max_retries:
+                logging.error(f"Giving up on {len(batch)} leave-session notifications: {error}")
+                metrics.LEAVE_NOTIFICATIONS.labels('failed').inc(len(batch))
+                return
+            logging.warning(f"Leave-session request failed ({error}), retrying in {delay}s")
+            await asyncio.sleep(delay)
+            delay *= 2
+
+        if response.status_code != 200:
+            logging.error(f"Error communicating with matching service: {response.content}")
+            metrics.LEAVE_NOTIFICATIONS.labels('failed').inc(len(batch))
+            return
+        metrics.LEAVE_NOTIFICATIONS.labels('sent').inc(len(batch))
+        for result in response.json().get("results", []):
+            if result.get("ok"):
+                logging.info(f"Requested matching service to mark user {result.get('userId')} "
+                             f"as having left room {result.get('roomId')}")
+            else:
+                logging.error(f"User {result.get('userId')} was not in an ongoing session in room {result.get('roomId')}")
@@ -0,0 +1,235 @@
+"""
+Load generator for the collaboration service. Simulated Socket.IO clients join rooms, edit, move
+their cursors and disconnect, while stub user and matching services answer the server's upstream
+calls. For every step of rooms x edit rate it reports the throughput of each event type and the
+p50/p99 latency from a client emitting it to the other members of the room receiving it. Cursor
+moves are coalesced by the server, so fewer of them are received than sent.
+
+Usage: python loadtest.py [--rooms 10,100] [--rates 1,5] [--users 2] [--duration 10] [--wire msgpack]
+
+The server is started with uvicorn on --port, pointed at the stubs. Pass --url to drive a server
+that is already running instead; it must then use the stubs (USER_SERVICE_URL and
+MATCHING_SERVICE_URL on --stub-port and --stub-port + 1).
+
+Needs the Socket.IO client: pip install "python-socketio[asyncio_client]"
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+from collections import defaultdict
+
+import socketio
+import uvicorn
+
+import wire
+
+# Cursor positions double as message ids, so that the receiver can look up when it was sent
+_ids = iter(range(sys.maxsize))
+
+
+class Recorder:
+    def __init__(self):
+        self.sent_at: dict[object, float] = {}
+        self.sent: dict[str, int] = defaultdict(int)
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+
+    def send(self, event: str, key) -> None:
+        self.sent[event] += 1
+        self.sent_at[key] = time.perf_counter()
+
+    def receive(self, event: str, key) -> None:
+        sent_at = self.sent_at.get(key)
+        if sent_at is not None:
+            self.latencies[event].append(time.perf_counter() - sent_at)
+
+    def report(self, elapsed: float) -> None:
+        print(f"  {'event':<16}{'sent':>8}{'received':>10}{'recv/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+        for event in sorted(set(self.sent) | set(self.latencies)):
+            latencies = sorted(self.latencies[event])
+            p50 = _percentile(latencies, 50)
+            p99 = _percentile(latencies, 99)
+            print(f"  {event:<16}{self.sent[event]:>8}{len(latencies):>10}{len(latencies) / elapsed:>10.0f}"
+                  f"{p50:>10.2f}{p99:>10.2f}")
+
+
+def _percentile(values: list[float], percentile: int) -> float:
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, len(values) * percentile // 100)] * 1000
+
+
+async def _stub_user_service(scope, receive, send):
+    """GET /auth/verify-token: every "Bearer user-<n>" token is valid."""
+    if scope["type"] != "http":
+        return
+    headers = dict(scope["headers"])
+    token = headers.get(b"authorization", b"").decode().removeprefix("Bearer ")
+    user_id = token.removeprefix("user-")
+    await _respond(send, 200, {"data": {"id": user_id, "username": f"user {user_id}"}})
+
+
+async def _stub_matching_service(scope, receive, send):
+    """PUT /leave-session: accepts everything."""
+    if scope["type"] != "http":
+        return
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    data = json.loads(body or b"{}").get("data")
+    if isinstance(data, list):
+        await _respond(send, 200, {"results": [dict(entry, ok=True) for entry in data]})
+    else:
+        await _respond(send, 200, {"ok": "ok"})
+
+
+async def _respond(send, status: int, body: dict) -> None:
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": json.dumps(body).encode()})
+
+
+class Client:
+    def __init__(self, index: int, room_id: str, recorder: Recorder, wire_format: str):
+        self.index = index
+        self.wire = wire_format
+        self.room_id = room_id
+        self.recorder = recorder
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.sio.on("join_request", self._on_join)
+        self.sio.on("code_updated", self._on_code)
+        self.sio.on("cursors_updated", self._on_cursors)
+        self.sio.on("user_left", self._on_user_left)
+
+    async def connect(self, url: str) -> None:
+        await self.sio.connect(f"{url}?wire={self.wire}", headers={"Authorization": f"Bearer user-{self.index}"},
+                               transports=["websocket"], wait_timeout=30)
+
+    async def join(self) -> None:
+        self.recorder.send("join_request", ("join", self.index))
+        await self.sio.emit("join_request", wire.encode({"room_id": self.room_id}, self.wire))
+
+    async def edit(self, body: str) -> None:
+        message_id = next(_ids)
+        self.recorder.send("code_updated", message_id)
+        # The first line identifies the edit, the rest stands in for the document
+        await self.sio.emit("code_updated", wire.encode({"code": f"# {message_id}\n{body}"}, self.wire))
+
+    async def move_cursor(self) -> None:
+        message_id = next(_ids)
+        self.recorder.send("cursor_updated", message_id)
+        await self.sio.emit("cursor_updated", wire.encode({"cursor_position": message_id}, self.wire))
+
+    async def disconnect(self, record: bool = True) -> None:
+        if record:
+            self.recorder.send("disconnect", ("left", self.index))
+        await self.sio.disconnect()
+
+    async def _on_join(self, data):
+        data = wire.decode(data)
+        if "room_details" in data:
+            self.recorder.receive("join_request", ("join", int(data["user_id"])))
+
+    async def _on_code(self, code):
+        code = wire.decode(code)
+        self.recorder.receive("code_updated", int(code[2:code.index("\n")]))
+
+    async def _on_cursors(self, batch):
+        batch = wire.decode(batch)
+        for entry in batch:
+            if entry["sid"] != self.sio.get_sid():
+                self.recorder.receive("cursor_updated", entry["cursor_position"])
+
+    async def _on_user_left(self, data):
+        data = wire.decode(data)
+        self.recorder.receive("disconnect", ("left", int(data["uid"])))
+
+
+async def _step(url: str, rooms: int, users: int, rate: float, duration: float, code_bytes: int,
+                wire_format: str) -> None:
+    recorder = Recorder()
+    body = "x" * code_bytes
+    clients = [Client(room * users + user, f"loadtest-{room}", recorder, wire_format)
+               for room in range(rooms) for user in range(users)]
+    connecting = asyncio.Semaphore(50)
+
+    async def connect(client: Client):
+        async with connecting:
+            await client.connect(url)
+
+    await asyncio.gather(*(connect(client) for client in clients))
+    await asyncio.gather(*(client.join() for client in clients))
+    await asyncio.sleep(1)
+
+    async def drive(client: Client):
+        # Poisson arrivals at `rate` edits and `rate` cursor moves per second
+        deadline = time.perf_counter() + duration
+        while True:
+            await asyncio.sleep(random.expovariate(rate))
+            if time.perf_counter() >= deadline:
+                return
+            await client.edit(body)
+            await client.move_cursor()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(drive(client) for client in clients))
+    await asyncio.sleep(1)
+    # The first member of each room leaves while the others are still there to see it
+    await asyncio.gather(*(client.disconnect() for client in clients if client.index % users == 0))
+    await asyncio.sleep(1)
+    elapsed = time.perf_counter() - start
+    await asyncio.gather(*(client.disconnect(record=False) for client in clients if client.index % users != 0))
+
+    print(f"{rooms} rooms x {users} users, {rate} edits/s per user, {duration}s, {wire_format}:")
+    recorder.report(elapsed)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rooms", default="10,100", help="comma-separated room counts")
+    parser.add_argument("--rates", default="1,5", help="comma-separated edits per second per user")
+    parser.add_argument("--users", type=int, default=2, help="users per room")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per step")
+    parser.add_argument("--code-bytes", type=int, default=2048, help="size of the document")
+    parser.add_argument("--wire", choices=wire.FORMATS, default=wire.JSON, help="wire format of the clients")
+    parser.add_argument("--port", type=int, default=3905)
+    parser.add_argument("--stub-port", type=int, default=3901)
+    parser.add_argument("--url", help="drive a running server instead of starting one")
+    args = parser.parse_args()
+
+    stubs = [uvicorn.Server(uvicorn.Config(app, port=args.stub_port + i, log_level="warning"))
+             for i, app in enumerate((_stub_user_service, _stub_matching_service))]
+    stub_tasks = [asyncio.create_task(stub.serve()) for stub in stubs]
+    server = None
+    url = args.url
+    if url is None:
+        env = dict(os.environ, USER_SERVICE_URL=f"http://localhost:{args.stub_port}",
+                   MATCHING_SERVICE_URL=f"http://localhost:{args.stub_port + 1}", LOG_LEVEL="30")
+        server = subprocess.Popen(["uvicorn", "server:app", "--port", str(args.port), "--log-level", "warning"],
+                                  cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+        url = f"http://localhost:{args.port}"
+    await asyncio.sleep(2)
+
+    try:
+        for rooms in map(int, args.rooms.split(",")):
+            for rate in map(float, args.rates.split(",")):
+                await _step(url, rooms, args.users, rate, args.duration, args.code_bytes, args.wire)
+    finally:
+        if server is not None:
+            server.terminate()
+            # The stubs run on this loop and must keep answering while the server shuts down
+            await asyncio.get_running_loop().run_in_executor(None, server.wait)
+        for stub in stubs:
+            stub.should_exit = True
+        await asyncio.gather(*stub_tasks)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
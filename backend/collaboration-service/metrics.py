@@ -0,0 +1,48 @@
+import time
+import functools
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+from models import Room, User
+
+# Handlers mostly take well under a millisecond, unless they wait on Redis or an upstream
+_LATENCY_BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5)
+
+EVENTS = Counter('collab_events_total', 'Socket.IO events handled', ['event'])
+HANDLER_ERRORS = Counter('collab_handler_errors_total', 'Socket.IO handlers that raised', ['event'])
+HANDLER_SECONDS = Histogram('collab_handler_seconds', 'Time spent in Socket.IO handlers', ['event'],
+                            buckets=_LATENCY_BUCKETS)
+EMITS = Counter('collab_emits_total', 'Events emitted to rooms', ['event'])
+EMIT_FAILURES = Counter('collab_emit_failures_total', 'Events that could not be emitted', ['event'])
+AUTH_UPSTREAM_SECONDS = Histogram('collab_auth_upstream_seconds', 'Token verifications by the user service',
+                                  buckets=_LATENCY_BUCKETS)
+AUTH_CACHE = Counter('collab_auth_cache_total', 'Token cache lookups', ['result'])
+LEAVE_NOTIFICATIONS = Counter('collab_leave_notifications_total', 'Leave-session notifications', ['result'])
+LEAVE_QUEUE_SIZE = Gauge('collab_leave_queue_size', 'Leave-session notifications waiting to be sent')
+
+Gauge('collab_rooms', 'Rooms with users on this instance').set_function(lambda: len(Room.rooms))
+Gauge('collab_users', 'Users connected to this instance').set_function(lambda: len(User.users))
+Gauge('collab_room_users_max', 'Users in the largest room').set_function(
+    lambda: max((len(room.users) for room in list(Room.rooms.values())), default=0))
+
+
+def timed(event: str):
+    """Counts the calls of a handler and records how long they take."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            EVENTS.labels(event).inc()
+            start = time.perf_counter()
+            try:
+                return await handler(*args, **kwargs)
+            except Exception:
+                HANDLER_ERRORS.labels(event).inc()
+                raise
+            finally:
+                HANDLER_SECONDS.labels(event).observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def render() -> tuple[bytes, str]:
+    return generate_latest(), CONTENT_TYPE_LATEST
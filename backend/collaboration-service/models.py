@@ -1,15 +1,36 @@
 import logging
+import os
+import time
+import uuid
+from collections import deque
+
+import ot
+
+# Number of past operations kept to transform edits made against an older version
+HISTORY_LIMIT = int(os.environ.get('HISTORY_LIMIT', 200))
 
 class User:
+    """A connected session. A person with several tabs open has one User per sid."""
+    __slots__ = ('user_id', 'username', 'cursor_position', 'sid', 'delta_sync', 'wire', 'room')
+
     users: dict[str, "User"] = {}
+    # Sessions of each user_id, by sid
+    sessions: dict[object, dict[str, "User"]] = {}
 
-    def __init__(self, user_id, username: str, sid: str):
+    def __init__(self, user_id, username: str, sid: str, register: bool = True):
+        """`register` is False for users connected to another instance, which are not looked up by sid here."""
         self.user_id = user_id
         self.username = username
         self.cursor_position = 0
         self.sid = sid
+        # Whether this client edits with code_delta operations rather than full code_updated text
+        self.delta_sync = False
+        # Wire format negotiated by the client, see wire.py
+        self.wire = 'json'
         self.room: "Room" = None
-        User.users[sid] = self
+        if register:
+            User.users[sid] = self
+            User.sessions.setdefault(user_id, {})[sid] = self
 
     def join_room(self, room: "Room") -> None:
         self.room = room
@@ -26,7 +47,10 @@ class User:
     def __eq__(self, other) -> bool:
         if not isinstance(other, User):
             return False
-        return self.username == other.username
+        return self.sid == other.sid
+
+    def __hash__(self) -> int:
+        return hash(self.sid)
 
     def __repr__(self) -> str:
         return f'User(username={self.username}, cursor_position={self.cursor_position})'
@@ -37,29 +61,48 @@ class User:
     @classmethod
     def remove_user(cls, user: "User") -> None:
         del cls.users[user.sid]
+        sessions = cls.sessions.get(user.user_id)
+        if sessions is not None:
+            sessions.pop(user.sid, None)
+            if not sessions:
+                del cls.sessions[user.user_id]
+
+    @classmethod
+    def rooms_of(cls, user_id) -> set["Room"]:
+        """Rooms the user has a session in on this instance."""
+        return {user.room for user in cls.sessions.get(user_id, {}).values() if user.room is not None}
 
 
 class Room:
+    __slots__ = ('id', 'users', 'code', 'epoch', 'version', 'history', 'submitted', 'last_active')
+
     rooms: dict[str, "Room"] = {}
 
     def __init__(self, room_id: str, user: User):
         self.id = room_id
-        self.users: list[User] = [user]
+        # Members by sid, in the order they joined
+        self.users: dict[str, User] = {user.sid: user}
         self.code = ""
+        # Identifies this incarnation of the room, as versions start over if it is deleted and recreated
+        self.epoch = uuid.uuid4().hex
+        self.version = 0
+        self.history: deque[list] = deque(maxlen=HISTORY_LIMIT)
         self.submitted = False
+        # time.monotonic() of the last join, edit or cursor move, for evicting idle rooms
+        self.last_active = time.monotonic()
         Room.rooms[room_id] = self
         user.join_room(self)
 
     def add_user(self, user: User) -> None:
-        if user not in self.users:
-            self.users.append(user)
+        if user.sid not in self.users:
+            self.users[user.sid] = user
             user.join_room(self)
+            self.touch()
         else:
             logging.warning(f"User {user.sid} is already in room {self.id}")
 
     def remove_user(self, user: User) -> bool:
-        if user in self.users:
-            self.users.remove(user)
+        if self.users.pop(user.sid, None) is not None:
             User.remove_user(user)
             if len(self.users) == 0:
                 del Room.rooms[self.id]
@@ -72,23 +115,59 @@ class Room:
             logging.error(f"Attempted to remove user {user.sid} who is not in room {self.id}")
             return True
 
-    def update_code(self, code: str) -> None:
-        self.code = code
-
-    def details(self) -> dict:
-        return {
+    def update_code(self, code: str) -> list:
+        """Replaces the whole document, recording the change as an operation. Returns the operation."""
+        return self.apply_operation(ot.from_replacement(self.code, code), self.version)
+
+    def apply_operation(self, ops: list, base_version: int) -> list:
+        """
+        Applies an operation made against `base_version` of the document, transforming it past the
+        operations applied since. Returns the operation as applied to the current version.
+        """
+        oldest_version = self.version - len(self.history)
+        if not oldest_version <= base_version <= self.version:
+            raise ot.OperationError(f"Cannot apply an operation on version {base_version}, "
+                                    f"room {self.id} is at version {self.version}")
+        ops = ot.validate(ops)
+        for concurrent in list(self.history)[base_version - oldest_version:]:
+            ops, _ = ot.transform(ops, concurrent)
+        self.code = ot.apply(self.code, ops)
+        self.history.append(ops)
+        self.version += 1
+        self.touch()
+        return ops
+
+    def touch(self) -> None:
+        self.last_active = time.monotonic()
+
+    def changes_since(self, version: int) -> list[list] | None:
+        """The operations applied after `version`, or None if they are no longer in the history."""
+        oldest_version = self.version - len(self.history)
+        if not oldest_version <= version <= self.version:
+            return None
+        return list(self.history)[version - oldest_version:]
+
+    def details(self, include_code: bool = True) -> dict:
+        details = {
             'id': self.id,
-            'users': [user.details() for user in self.users],
-            'code': self.code,
+            'users': [user.details() for user in self.users.values()],
+            'epoch': self.epoch,
+            'version': self.version,
         }
+        if include_code:
+            details['code'] = self.code
+        return details
 
     def __eq__(self, other) -> bool:
         if not isinstance(other, Room):
             return False
         return self.id == other.id
 
+    def __hash__(self) -> int:
+        return hash(self.id)
+
     def __repr__(self) -> str:
-        return f'Room(id={self.id}, users={self.users}, code={self.code})'
+        return f'Room(id={self.id}, users={list(self.users.values())}, code={self.code})'
 
     def __str__(self) -> str:
         return self.__repr__()
@@ -0,0 +1,163 @@
+"""
+Operational transformation for plain text, compatible with the ot.js TextOperation format.
+
+An operation is a list of components that walk over the whole document:
+  - a positive int retains that many characters,
+  - a negative int deletes that many characters,
+  - a str inserts that text.
+Positions count Unicode code points.
+"""
+
+
+class OperationError(ValueError):
+    pass
+
+
+def _is_retain(component) -> bool:
+    return isinstance(component, int) and not isinstance(component, bool) and component > 0
+
+
+def _is_delete(component) -> bool:
+    return isinstance(component, int) and not isinstance(component, bool) and component < 0
+
+
+def _is_insert(component) -> bool:
+    return isinstance(component, str)
+
+
+class _Builder:
+    """Accumulates components, merging neighbours so that operations stay in canonical form."""
+
+    def __init__(self):
+        self.ops: list = []
+
+    def retain(self, n: int) -> None:
+        if n <= 0:
+            return
+        if self.ops and _is_retain(self.ops[-1]):
+            self.ops[-1] += n
+        else:
+            self.ops.append(n)
+
+    def insert(self, text: str) -> None:
+        if not text:
+            return
+        if self.ops and _is_insert(self.ops[-1]):
+            self.ops[-1] += text
+        elif self.ops and _is_delete(self.ops[-1]):
+            # Inserts always go before deletes at the same position
+            if len(self.ops) > 1 and _is_insert(self.ops[-2]):
+                self.ops[-2] += text
+            else:
+                self.ops.insert(len(self.ops) - 1, text)
+        else:
+            self.ops.append(text)
+
+    def delete(self, n: int) -> None:
+        if n <= 0:
+            return
+        if self.ops and _is_delete(self.ops[-1]):
+            self.ops[-1] -= n
+        else:
+            self.ops.append(-n)
+
+
+def validate(ops) -> list:
+    if not isinstance(ops, list):
+        raise OperationError("Operation must be a list")
+    builder = _Builder()
+    for component in ops:
+        if _is_retain(component):
+            builder.retain(component)
+        elif _is_delete(component):
+            builder.delete(-component)
+        elif _is_insert(component):
+            builder.insert(component)
+        else:
+            raise OperationError(f"Invalid component {component!r}")
+    return builder.ops
+
+
+def base_length(ops: list) -> int:
+    return sum(abs(c) for c in ops if not _is_insert(c))
+
+
+def from_replacement(old: str, new: str) -> list:
+    """The operation that turns `old` into `new`, keeping their common prefix and suffix."""
+    prefix = 0
+    while prefix < min(len(old), len(new)) and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < min(len(old), len(new)) - prefix and old[-suffix - 1] == new[-suffix - 1]:
+        suffix += 1
+    builder = _Builder()
+    builder.retain(prefix)
+    builder.insert(new[prefix:len(new) - suffix])
+    builder.delete(len(old) - prefix - suffix)
+    builder.retain(suffix)
+    return builder.ops
+
+
+def apply(doc: str, ops: list) -> str:
+    if base_length(ops) != len(doc):
+        raise OperationError(f"Operation expects a document of length {base_length(ops)}, got {len(doc)}")
+    parts = []
+    index = 0
+    for component in ops:
+        if _is_retain(component):
+            parts.append(doc[index:index + component])
+            index += component
+        elif _is_delete(component):
+            index -= component
+        else:
+            parts.append(component)
+    return "".join(parts)
+
+
+def transform(a: list, b: list) -> tuple[list, list]:
+    """
+    Given two operations made concurrently on the same document, returns (a', b') such that applying
+    a then b' gives the same document as applying b then a'.
+    """
+    if base_length(a) != base_length(b):
+        raise OperationError("Concurrent operations must have the same base length")
+    a_prime, b_prime = _Builder(), _Builder()
+    ops1, ops2 = iter(a), iter(b)
+    op1, op2 = next(ops1, None), next(ops2, None)
+    while op1 is not None or op2 is not None:
+        if op1 is not None and _is_insert(op1):
+            a_prime.insert(op1)
+            b_prime.retain(len(op1))
+            op1 = next(ops1, None)
+            continue
+        if op2 is not None and _is_insert(op2):
+            a_prime.retain(len(op2))
+            b_prime.insert(op2)
+            op2 = next(ops2, None)
+            continue
+        if op1 is None or op2 is None:
+            raise OperationError("Operations have different lengths")
+
+        if _is_retain(op1) and _is_retain(op2):
+            length = min(op1, op2)
+            a_prime.retain(length)
+            b_prime.retain(length)
+            op1, op2 = op1 - length, op2 - length
+        elif _is_delete(op1) and _is_delete(op2):
+            # Both deleted the same text, nothing left to do for it
+            length = min(-op1, -op2)
+            op1, op2 = op1 + length, op2 + length
+        elif _is_delete(op1) and _is_retain(op2):
+            length = min(-op1, op2)
+            a_prime.delete(length)
+            op1, op2 = op1 + length, op2 - length
+        else:
+            length = min(op1, -op2)
+            b_prime.delete(length)
+            op1, op2 = op1 - length, op2 + length
+
+        if op1 == 0:
+            op1 = next(ops1, None)
+        if op2 == 0:
+            op2 = next(ops2, None)
+    return a_prime.ops, b_prime.ops
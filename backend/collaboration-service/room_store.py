@@ -0,0 +1,312 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+from collections import deque
+
+from redis import asyncio as aioredis
+from redis.exceptions import WatchError
+
+from models import HISTORY_LIMIT, Room, User
+
+# Safety net for rooms whose instances died without everyone leaving
+ROOM_TTL = int(os.environ.get('ROOM_TTL', 24 * 60 * 60))
+
+# Keeps the latest time.time() any instance saw activity in a room, and returns it
+_SHARE_ACTIVITY = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return ARGV[1]
+end
+local latest = tonumber(redis.call('HGET', KEYS[1], 'last_active') or '0')
+if tonumber(ARGV[1]) > latest then
+    redis.call('HSET', KEYS[1], 'last_active', ARGV[1])
+    return ARGV[1]
+end
+return tostring(latest)
+"""
+
+# Makes the snapshot of an evicted room its document again, unless the room exists
+_RESTORE_SNAPSHOT = """
+if redis.call('EXISTS', KEYS[1]) == 0 and redis.call('EXISTS', KEYS[2]) == 1 then
+    redis.call('RENAME', KEYS[2], KEYS[1])
+    return 1
+end
+return 0
+"""
+
+
+class LocalRoomStore:
+    """
+    Rooms kept only in the memory of this process. Every user of a room must connect to it.
+
+    If `snapshot_dir` is set, rooms evicted for being idle are saved there, and restored when
+    someone joins them again. Snapshots nobody came back for are deleted after `snapshot_ttl` seconds.
+    """
+
+    def __init__(self, snapshot_dir: str | None = None, snapshot_ttl: float = 0):
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_ttl = snapshot_ttl
+        if snapshot_dir:
+            os.makedirs(snapshot_dir, exist_ok=True)
+
+    async def join(self, room_id: str, user: User) -> Room:
+        if room_id not in Room.rooms and self.snapshot_dir:
+            room = Room(room_id, user)
+            await asyncio.to_thread(self._restore, room)
+            return room
+        return Room.get_or_create(room_id, user)
+
+    async def leave(self, user: User) -> bool:
+        """Removes the user from their room. Returns whether anyone is left in it."""
+        return user.room.remove_user(user)
+
+    async def update_code(self, room: Room, code: str) -> list:
+        return room.update_code(code)
+
+    async def apply_operation(self, room: Room, ops: list, base_version: int) -> list:
+        return room.apply_operation(ops, base_version)
+
+    async def submit(self, room: Room) -> None:
+        room.submitted = True
+
+    async def snapshot(self, room: Room) -> None:
+        """Saves the document of a room that is about to be evicted."""
+        if self.snapshot_dir:
+            await asyncio.to_thread(self._save, room)
+
+    async def sync_activity(self, room: Room) -> None:
+        """Brings `room.last_active` up to date with activity elsewhere. Every user is here, so there is none."""
+
+    async def prune_snapshots(self) -> int:
+        """Deletes the snapshots older than `snapshot_ttl`. Returns how many there were."""
+        if not self.snapshot_dir or self.snapshot_ttl <= 0:
+            return 0
+        return await asyncio.to_thread(self._prune)
+
+    async def close(self) -> None:
+        pass
+
+    def _snapshot_path(self, room_id: str) -> str:
+        # Room ids come from clients, so they are not used as file names directly
+        return os.path.join(self.snapshot_dir, hashlib.sha256(room_id.encode()).hexdigest() + '.json')
+
+    def _save(self, room: Room) -> None:
+        path = self._snapshot_path(room.id)
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'epoch': room.epoch, 'version': room.version, 'code': room.code,
+                       'submitted': room.submitted}, f)
+        os.replace(path + '.tmp', path)
+        logging.info(f"Saved a snapshot of room {room.id} at version {room.version}")
+
+    def _restore(self, room: Room) -> None:
+        path = self._snapshot_path(room.id)
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return
+        room.epoch = snapshot['epoch']
+        room.version = snapshot['version']
+        room.code = snapshot['code']
+        room.submitted = snapshot['submitted']
+        os.remove(path)
+        logging.info(f"Restored room {room.id} from its snapshot at version {room.version}")
+
+    def _prune(self) -> int:
+        cutoff = time.time() - self.snapshot_ttl
+        pruned = 0
+        for entry in os.scandir(self.snapshot_dir):
+            try:
+                if entry.name.endswith('.json') and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    pruned += 1
+            except FileNotFoundError:
+                # Restored in the meantime
+                continue
+        return pruned
+
+
+class RedisRoomStore(LocalRoomStore):
+    """
+    Rooms shared by every instance through Redis, so that the users of a room can be connected to
+    different instances and rooms survive restarts. `Room.rooms` stays as a read-through cache of
+    the rooms with users on this instance: edits check the version in Redis and only reload the
+    document when another instance changed it, and are committed with WATCH/MULTI so that
+    concurrent edits on different instances are transformed like edits on a single one.
+
+    Values in the hashes are JSON-encoded. Cursor positions are not stored; clients resend them
+    whenever someone joins.
+
+    The document of a room is deleted with it when the last user leaves. Evicted rooms are first
+    copied to a snapshot key, kept for `snapshot_ttl` seconds, which the next join restores.
+    """
+
+    def __init__(self, url: str, snapshot_ttl: float = 0):
+        super().__init__(snapshot_ttl=snapshot_ttl)
+        self.r = aioredis.from_url(url)
+        self._share_activity = self.r.register_script(_SHARE_ACTIVITY)
+        self._restore_snapshot = self.r.register_script(_RESTORE_SNAPSHOT)
+
+    async def join(self, room_id: str, user: User) -> Room:
+        room = Room.rooms.get(room_id)
+        if room is None:
+            room = Room(room_id, user)
+        else:
+            room.add_user(user)
+        if await self._restore_snapshot(keys=[_room_key(room_id), _snapshot_key(room_id)]):
+            logging.info(f"Restored room {room_id} from its snapshot")
+        async with self.r.pipeline() as pipe:
+            pipe.hsetnx(_room_key(room_id), 'epoch', json.dumps(uuid.uuid4().hex))
+            pipe.hsetnx(_room_key(room_id), 'code', json.dumps(''))
+            pipe.hsetnx(_room_key(room_id), 'version', json.dumps(0))
+            pipe.hsetnx(_room_key(room_id), 'submitted', json.dumps(False))
+            pipe.hset(_users_key(room_id), user.sid,
+                      json.dumps({'user_id': user.user_id, 'username': user.username}))
+            for key in _keys(room_id):
+                pipe.expire(key, ROOM_TTL)
+            await pipe.execute()
+        await self._load(room)
+        return room
+
+    async def leave(self, user: User) -> bool:
+        room = user.room
+        users_key = _users_key(room.id)
+        async with self.r.pipeline() as pipe:
+            while True:
+                try:
+                    await pipe.watch(users_key)
+                    members = await pipe.hgetall(users_key)
+                    remaining = len(members) - int(user.sid.encode() in members)
+                    submitted = json.loads(await pipe.hget(_room_key(room.id), 'submitted') or 'false')
+                    pipe.multi()
+                    if remaining:
+                        pipe.hdel(users_key, user.sid)
+                    else:
+                        pipe.delete(*_keys(room.id))
+                    await pipe.execute()
+                    break
+                except WatchError:
+                    continue
+        room.submitted = room.submitted or submitted
+        # Users who left through other instances are only dropped from the cached copy here
+        self._set_users(room, members)
+        room.users.setdefault(user.sid, user)
+        room.remove_user(user)
+        if not any(sid in User.users for sid in room.users):
+            # Nobody left here to keep the cached copy up to date
+            Room.rooms.pop(room.id, None)
+        if not remaining:
+            logging.info(f"Room {room.id} deleted from Redis as it became empty")
+        return remaining > 0
+
+    async def update_code(self, room: Room, code: str) -> list:
+        return await self._commit(room, lambda: room.update_code(code))
+
+    async def apply_operation(self, room: Room, ops: list, base_version: int) -> list:
+        return await self._commit(room, lambda: room.apply_operation(ops, base_version))
+
+    async def submit(self, room: Room) -> None:
+        room.submitted = True
+        await self.r.hset(_room_key(room.id), 'submitted', json.dumps(True))
+
+    async def snapshot(self, room: Room) -> None:
+        # Copied from Redis, which is more up to date than this instance if others edited the room.
+        # leave() deletes the document once the last user is gone, but not the snapshot
+        snapshot_key = _snapshot_key(room.id)
+        async with self.r.pipeline() as pipe:
+            pipe.copy(_room_key(room.id), snapshot_key, replace=True)
+            if self.snapshot_ttl > 0:
+                pipe.expire(snapshot_key, int(self.snapshot_ttl))
+            await pipe.execute()
+        logging.info(f"Saved a snapshot of room {room.id}")
+
+    async def sync_activity(self, room: Room) -> None:
+        # Users on other instances keep the room active too, even if nobody does anything here
+        now, wall_now = time.monotonic(), time.time()
+        latest = float(await self._share_activity(keys=[_room_key(room.id)],
+                                                  args=[json.dumps(wall_now - (now - room.last_active))]))
+        room.last_active = max(room.last_active, now - (wall_now - latest))
+
+    async def close(self) -> None:
+        await self.r.aclose()
+
+    async def _commit(self, room: Room, edit) -> list:
+        """Runs `edit` on an up-to-date copy of the room and writes the result, retrying on conflicts."""
+        room_key, history_key = _room_key(room.id), _history_key(room.id)
+        reload = False
+        async with self.r.pipeline() as pipe:
+            while True:
+                try:
+                    await pipe.watch(room_key)
+                    version = await pipe.hget(room_key, 'version')
+                    if reload or version is None or json.loads(version) != room.version:
+                        await self._load_document(room, pipe)
+                    ops = edit()
+                    pipe.multi()
+                    pipe.hset(room_key, mapping={'code': json.dumps(room.code), 'version': json.dumps(room.version)})
+                    pipe.rpush(history_key, json.dumps(ops))
+                    pipe.ltrim(history_key, -HISTORY_LIMIT, -1)
+                    for key in _keys(room.id):
+                        pipe.expire(key, ROOM_TTL)
+                    await pipe.execute()
+                    return ops
+                except WatchError:
+                    # The local copy now has an edit that lost the race, so it has to be reloaded
+                    logging.debug("Concurrent edit of room %s, retrying", room.id)
+                    reload = True
+
+    async def _load(self, room: Room) -> None:
+        await self._load_document(room, self.r)
+        self._set_users(room, await self.r.hgetall(_users_key(room.id)))
+
+    def _set_users(self, room: Room, members: dict[bytes, bytes]) -> None:
+        """Makes the members of the cached room those in Redis, which can be on any instance."""
+        users = {}
+        for sid, fields in members.items():
+            sid = sid.decode()
+            user = User.users.get(sid)
+            if user is None:
+                fields = json.loads(fields)
+                user = User(fields['user_id'], fields['username'], sid, register=False)
+                user.join_room(room)
+            users[sid] = user
+        room.users = users
+
+    async def _load_document(self, room: Room, r) -> None:
+        fields = await r.hgetall(_room_key(room.id))
+        history = await r.lrange(_history_key(room.id), 0, -1)
+        room.epoch = json.loads(fields.get(b'epoch', json.dumps(room.epoch).encode()))
+        room.code = json.loads(fields.get(b'code', b'""'))
+        room.version = json.loads(fields.get(b'version', b'0'))
+        room.submitted = json.loads(fields.get(b'submitted', b'false'))
+        room.history = deque((json.loads(ops) for ops in history), maxlen=HISTORY_LIMIT)
+
+
+def _room_key(room_id: str) -> str:
+    return f'collab:room:{room_id}'
+
+
+def _history_key(room_id: str) -> str:
+    return f'collab:room:{room_id}:history'
+
+
+def _users_key(room_id: str) -> str:
+    return f'collab:room:{room_id}:users'
+
+
+def _snapshot_key(room_id: str) -> str:
+    return f'collab:room:{room_id}:snapshot'
+
+
+def _keys(room_id: str) -> tuple[str, str, str]:
+    return _room_key(room_id), _history_key(room_id), _users_key(room_id)
+
+
+def create_store(redis_url: str | None, snapshot_dir: str | None = None, snapshot_ttl: float = 0) -> LocalRoomStore:
+    if redis_url:
+        logging.info("Sharing rooms through Redis")
+        return RedisRoomStore(redis_url, snapshot_ttl)
+    return LocalRoomStore(snapshot_dir, snapshot_ttl)
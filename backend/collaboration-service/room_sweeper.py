@@ -0,0 +1,70 @@
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from models import Room
+from room_store import LocalRoomStore
+
+
+class RoomSweeper:
+    """
+    Every `interval` seconds, evicts the rooms of this instance that have had no join, edit or
+    cursor move for `idle_ttl` seconds, here or on another instance sharing them through `store`,
+    such as rooms whose sockets died without disconnecting. Also deletes the store's old snapshots.
+    """
+
+    def __init__(self, interval: float, idle_ttl: float, store: LocalRoomStore,
+                 evict: Callable[[Room], Awaitable[None]]):
+        self.interval = interval
+        self.idle_ttl = idle_ttl
+        self._store = store
+        self._evict = evict
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None and self.idle_ttl > 0:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def sweep(self) -> int:
+        """Evicts the idle rooms. Returns how many there were."""
+        idle = []
+        for room in list(Room.rooms.values()):
+            try:
+                await self._store.sync_activity(room)
+            except Exception as e:
+                # Kept until it is known to be idle everywhere
+                logging.error(f"Failed to share the activity of room {room.id}: {e}")
+                continue
+            if room.last_active < time.monotonic() - self.idle_ttl:
+                idle.append(room)
+        for room in idle:
+            try:
+                await self._evict(room)
+            except Exception as e:
+                logging.error(f"Failed to evict idle room {room.id}: {e}")
+        return len(idle)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            evicted = await self.sweep()
+            if evicted:
+                logging.info(f"Evicted {evicted} idle rooms")
+            try:
+                pruned = await self._store.prune_snapshots()
+            except OSError as e:
+                logging.error(f"Failed to delete old room snapshots: {e}")
+            else:
+                if pruned:
+                    logging.info(f"Deleted {pruned} room snapshots nobody came back for")
@@ -1,40 +1,159 @@
 import socketio
 import logging
 import os
+import json
+import time
 import dotenv
-import requests
 
 dotenv.load_dotenv()
 MATCHING_SERVICE_URL = os.environ.get('MATCHING_SERVICE_URL')
 if not MATCHING_SERVICE_URL:
     raise ValueError('MATCHING_SERVICE_URL environment variable not set')
 
+from backpressure import OutboundLimiter
+from cursor_batcher import CursorBatcher
 from events import Events
+from leave_queue import LeaveSessionQueue
+import metrics
 from models import Room, User
-from user_verification import authenticate
+from ot import OperationError
+from room_store import create_store
+from room_sweeper import RoomSweeper
+from user_verification import authenticate, verifier
+import wire
 
 logging.basicConfig(level=int(os.environ.get('LOG_LEVEL', logging.INFO)))
+CURSOR_FLUSH_INTERVAL = float(os.environ.get('CURSOR_FLUSH_INTERVAL', 0.05))
+# With Redis, rooms and Socket.IO messages are shared so that several instances can serve a room
+REDIS_HOST = os.environ.get('REDIS_HOST')
+REDIS_URL = f"redis://{REDIS_HOST}:{os.environ.get('REDIS_PORT', 6379)}/0" if REDIS_HOST else None
+LEAVE_QUEUE_SIZE = int(os.environ.get('LEAVE_QUEUE_SIZE', 10000))
+LEAVE_BATCH_SIZE = int(os.environ.get('LEAVE_BATCH_SIZE', 50))
+LEAVE_MAX_RETRIES = int(os.environ.get('LEAVE_MAX_RETRIES', 5))
+# Rooms without activity for this long are evicted, set 0 to keep them until everyone leaves
+ROOM_IDLE_TTL = float(os.environ.get('ROOM_IDLE_TTL', 60 * 60))
+ROOM_SWEEP_INTERVAL = float(os.environ.get('ROOM_SWEEP_INTERVAL', 60))
+# Without Redis, evicted rooms are saved here if set, and restored when someone joins them again.
+# With Redis, they are saved to a key of their own
+ROOM_SNAPSHOT_DIR = os.environ.get('ROOM_SNAPSHOT_DIR')
+# Seconds a snapshot is kept for someone to rejoin its room, 0 to keep them forever
+ROOM_SNAPSHOT_TTL = float(os.environ.get('ROOM_SNAPSHOT_TTL', 7 * 24 * 60 * 60))
+# Packets a client can have waiting to be written before it misses latest-state events, 0 for no limit
+OUTBOUND_MAX_QUEUED = int(os.environ.get('OUTBOUND_MAX_QUEUED', 32))
+OUTBOUND_CHECK_INTERVAL = float(os.environ.get('OUTBOUND_CHECK_INTERVAL', 0.5))
 
-sio = socketio.AsyncServer(cors_allowed_origins='*', async_mode='asgi')
-app = socketio.ASGIApp(sio)
+
+async def stats_app(scope, receive, send):
+    """Plain HTTP routes served next to Socket.IO."""
+    if scope['type'] == 'lifespan':
+        # Handled by socketio.ASGIApp, but acknowledged in case a server passes it on
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] == 'websocket':
+        # Only Socket.IO takes websockets, closing before accepting rejects the handshake
+        await receive()
+        await send({'type': 'websocket.close'})
+        return
+    if scope['type'] != 'http':
+        return
+    content_type = b'application/json'
+    if scope['path'] == '/metrics':
+        status, (body, content_type) = 200, metrics.render()
+        content_type = content_type.encode()
+    elif scope['path'] == '/stats/auth':
+        status, body = 200, json.dumps(verifier.stats()).encode()
+    else:
+        status, body = 404, json.dumps({'detail': 'Not Found'}).encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', content_type)]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def emit_cursors(room_id: str, batch: list[dict]) -> None:
+    await emit(Events.CURSORS_UPDATED, batch, room_id, drop_slow=True)
+
+
+async def resync(sid: str) -> None:
+    """Sends the current document to a client that missed code updates for being too slow."""
+    user: User = User.users.get(sid)
+    if user is None or user.room is None:
+        return
+    room: Room = user.room
+    if user.delta_sync:
+        data = {'epoch': room.epoch, 'version': room.version, 'code': room.code}
+        await sio.emit(Events.CODE_RESYNC, wire.encode(data, user.wire), to=sid)
+    else:
+        await sio.emit(Events.CODE_UPDATED, wire.encode(room.code, user.wire), to=sid)
+
+
+async def evict_room(room: Room) -> None:
+    """Saves an idle room if snapshots are on, then disconnects its users here, which deletes it."""
+    logging.info(f"Evicting room {room.id}, idle for {time.monotonic() - room.last_active:.0f}s")
+    await store.snapshot(room)
+    for sid in list(room.users):
+        user: User = User.users.get(sid)
+        if user is None:
+            # Connected to another instance
+            continue
+        if sio.manager.is_connected(sid, '/'):
+            await sio.disconnect(sid)
+        else:
+            # Its socket is gone without a disconnect event
+            await store.leave(user)
+            leave_queue.put(room.id, user.user_id)
+    # Only users of other instances can be left, which that instance keeps track of
+    Room.rooms.pop(room.id, None)
+
+
+async def on_startup() -> None:
+    cursor_batcher.start()
+    leave_queue.start()
+    room_sweeper.start()
+    outbound.start()
+
+
+async def on_shutdown() -> None:
+    await cursor_batcher.stop()
+    await room_sweeper.stop()
+    await outbound.stop()
+    await leave_queue.stop()
+    await verifier.close()
+    await store.close()
+
+
+client_manager = socketio.AsyncRedisManager(REDIS_URL) if REDIS_URL else None
+sio = socketio.AsyncServer(cors_allowed_origins='*', async_mode='asgi', client_manager=client_manager)
+app = socketio.ASGIApp(sio, other_asgi_app=stats_app, on_startup=on_startup, on_shutdown=on_shutdown)
+cursor_batcher = CursorBatcher(CURSOR_FLUSH_INTERVAL, emit_cursors)
+store = create_store(REDIS_URL, ROOM_SNAPSHOT_DIR, ROOM_SNAPSHOT_TTL)
+room_sweeper = RoomSweeper(ROOM_SWEEP_INTERVAL, ROOM_IDLE_TTL, store, evict_room)
+outbound = OutboundLimiter(sio, OUTBOUND_MAX_QUEUED, OUTBOUND_CHECK_INTERVAL, resync)
+leave_queue = LeaveSessionQueue(MATCHING_SERVICE_URL, LEAVE_QUEUE_SIZE, LEAVE_BATCH_SIZE, LEAVE_MAX_RETRIES)
+metrics.LEAVE_QUEUE_SIZE.set_function(leave_queue.qsize)
 unauthenticated_sids = set()
 
 
 @sio.event
+@metrics.timed('connect')
 async def connect(sid, environ):
     logging.info(f'connect {sid=}')
     token = None
     for header in environ['asgi.scope']['headers']:
         if header[0].lower() == b'authorization':
             token = header[1].decode()  # Extract token
-            logging.debug(f"connect {token=}")
+            logging.debug("connect token=%r", token)
             break
     if token:
-        user = authenticate(token)
+        user = await authenticate(token) or {}
         user_id = user.get('id', None)
         username = user.get('username', None)
         if user_id and username:
-            User(user_id, username, sid)
+            User(user_id, username, sid).wire = wire.negotiate(environ.get('QUERY_STRING', ''))
             logging.info(f"User {username} authenticated and connected with sid {sid}")
         else:
             unauthenticated_sids.add(sid)
@@ -47,8 +166,14 @@ async def connect(sid, environ):
 
 
 @sio.on(Events.JOIN_REQUEST)
+@metrics.timed(Events.JOIN_REQUEST)
 async def join_request(sid, data):
-    logging.debug(f'join_request {sid=} {data=}')
+    """
+    A client rejoining after a disconnect can send the `epoch` and `version` of the document it last
+    saw, and gets the operations it missed instead of the whole document when they are still known.
+    """
+    data = wire.decode(data)
+    logging.debug("join_request sid=%r data=%r", sid, data)
     room_id = data.get('room_id')
     
     if not room_id:
@@ -61,25 +186,40 @@ async def join_request(sid, data):
         logging.error(f"User not found for sid {sid} during join_request")
         return
     
+    # Clients that can apply code_delta operations say so when joining
+    user.delta_sync = bool(data.get('delta', user.delta_sync))
     await sio.enter_room(sid, room_id)
-    room: Room = Room.get_or_create(room_id, user)
+    await sio.enter_room(sid, wire_channel(room_id, user.wire))
+    # A client rejoining with a different `delta` must not get edits in both forms
+    await sio.leave_room(sid, wire_channel(code_channel(room_id, not user.delta_sync), user.wire))
+    await sio.enter_room(sid, wire_channel(code_channel(room_id, user.delta_sync), user.wire))
+    room: Room = await store.join(room_id, user)
     
     if user.room is None:
         logging.error(f"After join_request, user.room is None for sid {sid}")
     else:
-        logging.debug(f"User {sid} joined room {room.id}")
+        logging.debug("User %s joined room %s", sid, room.id)
 
-    data = {
-        "user_id": user.user_id,
-        "room_details": room.details()
-    }
+    last_version = data.get('version')
+    missed = None
+    if data.get('epoch') == room.epoch and isinstance(last_version, int):
+        missed = room.changes_since(last_version)
+    room_details = room.details(include_code=missed is None)
+    if missed is not None:
+        room_details['ops'] = missed
+        logging.debug("Resuming sid %s from version %s with %d operations", sid, last_version, len(missed))
     
-    await sio.emit(Events.JOIN_REQUEST, data, room=room_id)
+    # The state goes to the joiner only, the others just learn that someone joined
+    await sio.emit(Events.JOIN_REQUEST, wire.encode({"user_id": user.user_id, "room_details": room_details}, user.wire),
+                   to=sid)
+    await emit(Events.JOIN_REQUEST, {"user_id": user.user_id, "user": user.details()}, room_id, skip_sid=sid)
 
 
 @sio.on(Events.CODE_UPDATED)
+@metrics.timed(Events.CODE_UPDATED)
 async def code_updated(sid, data):
-    logging.debug(f'code_updated {sid=} {data=}')
+    data = wire.decode(data)
+    logging.debug("code_updated sid=%r data=%r", sid, data)
     code = data.get('code')
     
     if code is None:
@@ -96,18 +236,107 @@ async def code_updated(sid, data):
         logging.error(f"User {sid} is not associated with any room during code_updated")
         return
     
-    user.room.update_code(code)
+    ops = await store.update_code(user.room, code)
     
     try:
-        await sio.emit(Events.CODE_UPDATED, code, room=user.room.id, skip_sid=sid)
-        logging.debug(f"Emitted CODE_UPDATED to room {user.room.id}")
+        await broadcast_code(user.room, ops, sid)
+        logging.debug("Emitted CODE_UPDATED to room %s", user.room.id)
     except Exception as e:
         logging.error(f"Failed to emit CODE_UPDATED for user {sid}: {e}")
 
 
+@sio.on(Events.CODE_DELTA)
+@metrics.timed(Events.CODE_DELTA)
+async def code_delta(sid, data):
+    """
+    Incremental edit: `data` is {'version': <version the edit was made on>, 'ops': <ot operation>}.
+    Acknowledged with the version of the document after the edit, or with the full document if the
+    edit could not be applied and the client has to resynchronise.
+    """
+    data = wire.decode(data)
+    logging.debug("code_delta sid=%r data=%r", sid, data)
+    version = data.get('version')
+    ops = data.get('ops')
+    
+    if not isinstance(version, int) or ops is None:
+        logging.error(f"Missing version or ops in code_delta from sid {sid}")
+        return
+    
+    user: User = User.users.get(sid)
+    
+    if user is None:
+        logging.error(f"User not found for sid {sid} during code_delta")
+        return
+    
+    if user.room is None:
+        logging.error(f"User {sid} is not associated with any room during code_delta")
+        return
+    
+    room: Room = user.room
+    if not user.delta_sync:
+        user.delta_sync = True
+        await sio.leave_room(sid, wire_channel(code_channel(room.id, False), user.wire))
+        await sio.enter_room(sid, wire_channel(code_channel(room.id, True), user.wire))
+    try:
+        ops = await store.apply_operation(room, ops, version)
+    except OperationError as e:
+        logging.warning(f"Rejected code_delta from sid {sid}: {e}")
+        return wire.encode({'error': str(e), 'version': room.version, 'code': room.code}, user.wire)
+    
+    try:
+        await broadcast_code(room, ops, sid)
+        logging.debug("Emitted CODE_DELTA to room %s", room.id)
+    except Exception as e:
+        logging.error(f"Failed to emit CODE_DELTA for user {sid}: {e}")
+    return wire.encode({'version': room.version}, user.wire)
+
+
+def code_channel(room_id: str, delta_sync: bool) -> str:
+    """Socket.IO room of the members of `room_id` receiving edits as operations, or as full text."""
+    return f"{room_id}:{'delta' if delta_sync else 'text'}"
+
+
+async def broadcast_code(room: Room, ops: list, skip_sid: str) -> None:
+    """Sends an edit to everyone else in the room: as an operation to delta clients, as full text to the others."""
+    delta = {'version': room.version, 'ops': ops, 'sid': skip_sid}
+    code = room.code
+    await emit(Events.CODE_DELTA, delta, code_channel(room.id, True), skip_sid=skip_sid, resync=True)
+    await emit(Events.CODE_UPDATED, code, code_channel(room.id, False), skip_sid=skip_sid, resync=True)
+
+
+def wire_channel(room: str, wire_format: str) -> str:
+    """Socket.IO room of the members of `room` using the given wire format."""
+    return f"{room}:{wire_format}"
+
+
+async def emit(event: str, data, room: str, skip_sid: str | None = None,
+               drop_slow: bool = False, resync: bool = False) -> None:
+    """
+    Emits to the members of `room`, encoding `data` once for each wire format. With `drop_slow`,
+    the event only carries the latest state and is not sent to clients that are falling behind;
+    `resync` also sends them the whole document once they catch up, see `OutboundLimiter`.
+    """
+    for wire_format in wire.FORMATS:
+        channel = wire_channel(room, wire_format)
+        # With a Redis manager members may be on other instances, so only skip encoding when local
+        if client_manager is None and next(sio.manager.get_participants('/', channel), None) is None:
+            continue
+        skip = [skip_sid] if skip_sid else []
+        if drop_slow or resync:
+            skip += outbound.skipped(channel, resync)
+        try:
+            await sio.emit(event, wire.encode(data, wire_format), room=channel, skip_sid=skip or None)
+        except Exception:
+            metrics.EMIT_FAILURES.labels(event).inc()
+            raise
+        metrics.EMITS.labels(event).inc()
+
+
 @sio.on(Events.CURSOR_UPDATED)
+@metrics.timed(Events.CURSOR_UPDATED)
 async def cursor_updated(sid, data):
-    logging.debug(f'cursor_updated {sid=} {data=}')
+    data = wire.decode(data)
+    logging.debug("cursor_updated sid=%r data=%r", sid, data)
     cursor_position = data.get('cursor_position')
     
     if cursor_position is None:
@@ -125,22 +354,16 @@ async def cursor_updated(sid, data):
         return
     
     user.update_cursor_position(cursor_position)
-    
-    try:
-        await sio.emit(
-            Events.CURSOR_UPDATED,
-            {'sid': sid, 'cursor_position': cursor_position},
-            room=user.room.id,
-            skip_sid=sid
-        )
-        logging.debug(f"Emitted CURSOR_UPDATED to room {user.room.id}")
-    except Exception as e:
-        logging.error(f"Failed to emit CURSOR_UPDATED for user {sid}: {e}")
+    user.room.touch()
+    # Sent to the room with everyone else's latest position at the next tick
+    cursor_batcher.update(user.room.id, sid, cursor_position)
 
 
 @sio.on(Events.LANGUAGE_CHANGE)
+@metrics.timed(Events.LANGUAGE_CHANGE)
 async def language_change(sid, data):
-    logging.debug(f'language_change {sid=} {data=}')
+    data = wire.decode(data)
+    logging.debug("language_change sid=%r data=%r", sid, data)
     language = data.get('language')
     room_id = data.get('room_id')
     
@@ -153,14 +376,15 @@ async def language_change(sid, data):
         return
     
     try:
-        await sio.emit(Events.LANGUAGE_CHANGE, language, room=room_id, skip_sid=sid)
-        logging.debug(f"Emitted LANGUAGE_CHANGE to room {room_id}")
+        await emit(Events.LANGUAGE_CHANGE, language, room_id, skip_sid=sid)
+        logging.debug("Emitted LANGUAGE_CHANGE to room %s", room_id)
     except Exception as e:
         logging.error(f"Failed to emit LANGUAGE_CHANGE for user {sid}: {e}")
 
 @sio.on(Events.CODE_SUBMITTED)
+@metrics.timed(Events.CODE_SUBMITTED)
 async def code_submitted(sid):
-    logging.debug(f'code_submitted {sid=}')
+    logging.debug("code_submitted sid=%r", sid)
     user: User = User.users.get(sid)
 
     if user is None:
@@ -171,11 +395,11 @@ async def code_submitted(sid):
         logging.error(f"User {sid} is not associated with any room")
         return
 
-    user.room.submitted = True
+    await store.submit(user.room)
     
     try:
-        await sio.emit(Events.CODE_SUBMITTED, None, room=user.room.id, skip_sid=sid)
-        logging.debug(f"Emitted CODE_SUBMITTED to room {user.room.id}")
+        await emit(Events.CODE_SUBMITTED, None, user.room.id, skip_sid=sid)
+        logging.debug("Emitted CODE_SUBMITTED to room %s", user.room.id)
     except Exception as e:
         logging.error(f"Failed to emit CODE_SUBMITTED for user {sid}: {e}")
 
@@ -183,6 +407,7 @@ async def code_submitted(sid):
 
 
 @sio.event
+@metrics.timed('disconnect')
 async def disconnect(sid):
     logging.info(f'disconnect {sid=}')
     
@@ -198,21 +423,21 @@ async def disconnect(sid):
     
     room: Room = user.room
     
+    outbound.discard(sid)
     if room is None:
         logging.error(f"User {sid} has no room during disconnect")
+        User.remove_user(user)
         return
 
-    room_still_exists = room.remove_user(user)
+    cursor_batcher.discard(room.id, sid)
+    room_still_exists = await store.leave(user)
     
     if room_still_exists and not room.submitted:
         try:
-            await sio.emit(Events.USER_LEFT, {"sid": sid, "uid": user.user_id}, room=room.id)
-            logging.debug(f"Emitted USER_LEFT to room {room.id}")
+            await emit(Events.USER_LEFT, {"sid": sid, "uid": user.user_id}, room.id)
+            logging.debug("Emitted USER_LEFT to room %s", room.id)
         except Exception as e:
             logging.error(f"Failed to emit USER_LEFT for room {room.id}: {e}")
     
-    response = requests.put(f"{MATCHING_SERVICE_URL}/leave-session", json={"data": {"roomId": room.id, "userId": user.user_id} })
-    if response.status_code != 200:
-        logging.error(f"Error communicating with matching service: {response.content}")
-    else:
-        logging.info(f"Requested matching service to mark user {user.user_id} as having left room {room.id}")
+    # Sent to the matching service in the background
+    leave_queue.put(room.id, user.user_id)
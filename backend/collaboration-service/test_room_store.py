@@ -0,0 +1,57 @@
+import unittest
+
+import fakeredis
+
+from models import Room, User
+from room_store import RedisRoomStore, _keys, _snapshot_key
+
+
+class RedisEvictionTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        User.users.clear()
+        User.sessions.clear()
+        Room.rooms.clear()
+        self.store = RedisRoomStore('redis://localhost', snapshot_ttl=60)
+        self.store.r = fakeredis.FakeAsyncRedis()
+        self.store._share_activity = self.store.r.register_script(self.store._share_activity.script)
+        self.store._restore_snapshot = self.store.r.register_script(self.store._restore_snapshot.script)
+
+    async def asyncTearDown(self):
+        await self.store.close()
+
+    async def evict(self, room: Room) -> None:
+        # As server.evict_room does, for users whose sockets are gone
+        await self.store.snapshot(room)
+        for user in list(room.users.values()):
+            await self.store.leave(user)
+
+    async def test_rejoining_an_evicted_room_restores_its_document(self):
+        room = await self.store.join('room', User(1, 'ada', 'sid-1'))
+        await self.store.update_code(room, 'print(1)')
+        epoch, version = room.epoch, room.version
+
+        await self.evict(room)
+        self.assertEqual(await self.store.r.exists(*_keys('room')), 0)
+        self.assertNotIn('room', Room.rooms)
+
+        room = await self.store.join('room', User(1, 'ada', 'sid-2'))
+        self.assertEqual(room.code, 'print(1)')
+        self.assertEqual((room.epoch, room.version), (epoch, version))
+        self.assertEqual(await self.store.r.exists(_snapshot_key('room')), 0)
+
+    async def test_snapshot_expires(self):
+        room = await self.store.join('room', User(1, 'ada', 'sid-1'))
+        await self.evict(room)
+        self.assertGreater(await self.store.r.ttl(_snapshot_key('room')), 0)
+
+    async def test_rooms_emptied_without_eviction_start_over(self):
+        room = await self.store.join('room', User(1, 'ada', 'sid-1'))
+        await self.store.update_code(room, 'print(1)')
+        await self.store.leave(User.users['sid-1'])
+
+        room = await self.store.join('room', User(1, 'ada', 'sid-2'))
+        self.assertEqual(room.code, '')
+
+
+if __name__ == '__main__':
+    unittest.main()
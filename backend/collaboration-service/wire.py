@@ -0,0 +1,63 @@
+"""
+Wire formats of event payloads. Clients choose one when connecting, with a `wire` query parameter,
+and get JSON if they do not.
+
+  - json: payloads are sent as they are, and Socket.IO encodes them as JSON text.
+  - msgpack: payloads are MessagePack, sent as binary. Payloads of COMPRESS_THRESHOLD bytes or
+    more are zlib-compressed. The first byte says which: RAW or COMPRESSED.
+
+Clients using msgpack may send their events encoded the same way.
+"""
+import os
+import zlib
+import msgpack
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+FORMATS = (JSON, MSGPACK)
+
+COMPRESS_THRESHOLD = int(os.environ.get('WIRE_COMPRESS_THRESHOLD', 1024))
+COMPRESS_LEVEL = int(os.environ.get('WIRE_COMPRESS_LEVEL', 1))
+# Largest payload accepted from a client once decompressed, so that a small compressed frame cannot
+# expand into gigabytes
+MAX_DECODED = int(os.environ.get('WIRE_MAX_DECODED_BYTES', 1024 * 1024))
+
+RAW = b'\x00'
+COMPRESSED = b'\x01'
+
+
+def negotiate(query_string: str) -> str:
+    """The format asked for in the query string of the connection, if it is supported."""
+    for parameter in query_string.split('&'):
+        name, _, value = parameter.partition('=')
+        if name == 'wire' and value in FORMATS:
+            return value
+    return JSON
+
+
+def encode(data, wire: str):
+    if wire == JSON:
+        return data
+    packed = msgpack.packb(data)
+    if len(packed) >= COMPRESS_THRESHOLD:
+        return COMPRESSED + zlib.compress(packed, COMPRESS_LEVEL)
+    return RAW + packed
+
+
+def decode(payload):
+    """
+    Payloads from msgpack clients arrive as bytes, others as they were sent. Raises ValueError for
+    payloads larger than MAX_DECODED bytes, compressed or not.
+    """
+    if not isinstance(payload, bytes):
+        return payload
+    packed = payload[1:]
+    if payload[:1] == COMPRESSED:
+        decompressor = zlib.decompressobj()
+        packed = decompressor.decompress(packed, MAX_DECODED)
+        if decompressor.unconsumed_tail or not decompressor.eof:
+            raise ValueError(f"Rejected a compressed payload that is truncated or over {MAX_DECODED} bytes")
+    elif len(packed) > MAX_DECODED:
+        raise ValueError(f"Rejected a payload of over {MAX_DECODED} bytes")
+    return msgpack.unpackb(packed, max_str_len=MAX_DECODED, max_bin_len=MAX_DECODED,
+                           max_array_len=MAX_DECODED, max_map_len=MAX_DECODED, max_ext_len=MAX_DECODED)
@@ -132,12 +132,8 @@ app.get("/session-history", async (req, res) => {
   }
 });
 
-app.put("/leave-session", async (req, res) => {
-  if (!req.body.data) {
-    res.status(400).json({ error: "Request was malformed." });
-    return;
-  }
-  const { userId, roomId } = req.body.data;
+// Marks the user as having left the session, returning false if they were not in an ongoing one
+const leaveSession = async (userId: string, roomId: string): Promise<boolean> => {
   const record = await prisma.sessionHistory.findFirst({
     where: {
       isOngoing: true,
@@ -153,22 +149,42 @@ app.put("/leave-session", async (req, res) => {
     },
   });
   if (!record) {
+    return false;
+  }
+  const isUserOneActive = record.userOneId === userId ? false : record.isUserOneActive;
+  const isUserTwoActive = record.userTwoId === userId ? false : record.isUserTwoActive;
+  const isOngoing = isUserOneActive || isUserTwoActive;
+  await prisma.sessionHistory.update({
+    where: {
+      sessionId: record.sessionId,
+    },
+    data: {
+      isUserOneActive: isUserOneActive,
+      isUserTwoActive: isUserTwoActive,
+      isOngoing: isOngoing,
+    },
+  });
+  return true;
+};
+
+// `data` is either one { userId, roomId } or, for batches, an array of them
+app.put("/leave-session", async (req, res) => {
+  if (!req.body.data) {
+    res.status(400).json({ error: "Request was malformed." });
+    return;
+  }
+  if (Array.isArray(req.body.data)) {
+    const results = [];
+    for (const { userId, roomId } of req.body.data) {
+      results.push({ userId, roomId, ok: await leaveSession(userId, roomId) });
+    }
+    res.status(200).json({ results: results });
+    return;
+  }
+  const { userId, roomId } = req.body.data;
+  if (!(await leaveSession(userId, roomId))) {
     res.status(404).json({ error: "Request did not match with any ongoing session that the user is in." });
     return;
-  } else {
-    const isUserOneActive = record.userOneId === userId ? false : record.isUserOneActive;
-    const isUserTwoActive = record.userTwoId === userId ? false : record.isUserTwoActive;
-    const isOngoing = isUserOneActive || isUserTwoActive;
-    await prisma.sessionHistory.update({
-      where: {
-        sessionId: record.sessionId,
-      },
-      data: {
-        isUserOneActive: isUserOneActive,
-        isUserTwoActive: isUserTwoActive,
-        isOngoing: isOngoing,
-      },
-    });
   }
   res.status(200).json({ ok: "ok" });
 });
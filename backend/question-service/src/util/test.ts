@@ -16,10 +16,6 @@ export class InvalidInputError extends Error {
   }
 }
 
-async function sleep(ms: number) {
-  return new Promise((resolve) => setTimeout(resolve, ms));
-}
-
 interface CodeOutput {
   output: string;
   error: string;
@@ -72,9 +68,9 @@ export async function testCode(
   }
 
   const id = (await response.json()).id;
-  for (let i = 0; i < 15; i++) {
-    await sleep(500);
-    const resultResponse = await fetch(`${url}/?id=${id}`, {
+  // Long-poll: each request returns as soon as the task finishes
+  for (let i = 0; i < 3; i++) {
+    const resultResponse = await fetch(`${url}/wait?id=${id}&timeout=5`, {
       headers: {
         Authorization: `Bearer ${authtoken}`,
       },
@@ -200,22 +200,26 @@ const CodeContainer: React.FC<CodeContainerProps> = ({
       setCode(newCode);
     });
 
-    // Handle cursor updates
-    socket.on("cursor_updated", (userDetails: any) => {
-      const { sid, cursor_position } = userDetails;
-      if (sid === socket.id) return; // Ignore own cursor
+    // Handle cursor updates, batched by the server with the latest position of each user
+    socket.on("cursors_updated", (batch: any[]) => {
+      const updates: Record<string, { cursor_position: number; color: string }> = {};
+      for (const { sid, cursor_position } of batch) {
+        if (sid === socket.id) continue; // Ignore own cursor
+
+        if (typeof cursor_position !== "number") {
+          console.error(`Invalid cursor_position for sid ${sid}:`, cursor_position);
+          continue;
+        }
 
-      if (typeof cursor_position !== "number") {
-        console.error(`Invalid cursor_position for sid ${sid}:`, cursor_position);
-        return;
+        updates[sid] = {
+          cursor_position,
+          color: getColorForUser(sid),
+        };
       }
 
       setOtherCursors((prev) => ({
         ...prev,
-        [sid]: {
-          cursor_position,
-          color: getColorForUser(sid),
-        },
+        ...updates,
       }));
     });
 